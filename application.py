@@ -23,9 +23,15 @@ SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
 ENHANCEMENTS, OR MODIFICATIONS.
 """
 
+from itertools import islice
+import json
 import os
 import subprocess
+import sys
 
+import click
+from flask.cli import AppGroup
+from squiggy.configs import load_env_file
 from squiggy.factory import create_app
 
 """Squiggy says HELLO!
@@ -40,25 +46,106 @@ Usage mode B:
 >>> flask run --help
 >>> flask run --debugger
 >>> flask initdb
+>>> flask initdb --reset
+>>> flask import-users uids.csv
+>>> flask startup-profile
+>>> flask profiles list
+
+Usage mode C (production; see squiggy/lib/prefork.py):
+
+>>> flask serve --workers 4 --threads 8
+>>> flask serve --workers 4 --worker-class asyncio
 """
 
 # When running under WSGI, system environment variables are not automatically made available to Python code, and
 # an app restart will result in configurations being lost. We work around this with an explicit load from the shell
-# environment, sourcing from the Elastic Beanstalk-provided /opt/python/current/env file if available.
+# environment, reading from the Elastic Beanstalk-provided /opt/python/current/env file if available.
 if __name__.startswith('_mod_wsgi'):
-    command = ['bash', '-c', '{ source /opt/python/current/env || true; } && env']
-    shell_environment = subprocess.Popen(command, stdout=subprocess.PIPE)
-    for line in shell_environment.stdout:
-        key, _, value = line.decode('utf-8').rstrip().partition('=')
-        os.environ[key] = value
+    load_env_file('/opt/python/current/env')
 
 application = create_app()
 
 
 @application.cli.command()
-def initdb():
+@click.option('--reset', is_flag=True, help='Drop all tables and data first.')
+def initdb(reset):
     from squiggy.models import development_db
-    development_db.load()
+    if reset:
+        development_db.reset()
+    else:
+        development_db.load()
+
+
+@application.cli.command()
+@click.argument('csv_file', type=click.File('r'))
+@click.option('--batch-size', default=1000, help='Number of users per INSERT statement.')
+def import_users(csv_file, batch_size):
+    """Add or update users, by UID, from a CSV file with a 'uid' column (or UIDs in its first column)."""
+    from squiggy import std_commit
+    from squiggy.models.authorized_user import AuthorizedUser, uids_from_csv
+
+    uids = uids_from_csv(csv_file)
+    totals = {'inserted': 0, 'updated': 0}
+    while True:
+        batch = list(islice(uids, batch_size))
+        if not batch:
+            break
+        counts = AuthorizedUser.bulk_upsert(batch)
+        std_commit(allow_test_environment=True)
+        for key in totals:
+            totals[key] += counts[key]
+        click.echo(f"{totals['inserted']} inserted, {totals['updated']} updated")
+    click.echo(f"Done: {totals['inserted']} users inserted, {totals['updated']} updated.")
+
+
+@application.cli.command('startup-profile')
+@click.option('--imports', default=15, help='Number of slowest imports to list.')
+def startup_profile(imports):
+    """Time each phase of a cold start (imports, then create_app) in a fresh Python process."""
+    from squiggy.lib.startup import render_report
+
+    command = [sys.executable, '-X', 'importtime', '-m', 'squiggy.lib.startup']
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=application.config['BASE_DIR'])
+    if result.returncode:
+        click.echo(result.stderr.decode('utf-8'), err=True)
+        sys.exit(result.returncode)
+    phases = json.loads(result.stdout.decode('utf-8').strip().splitlines()[-1])
+    click.echo(render_report(phases, result.stderr.decode('utf-8').splitlines(), imports))
+
+
+@application.cli.command()
+@click.option('--host', help='Defaults to HOST.')
+@click.option('--port', type=int, help='Defaults to PORT.')
+@click.option('--workers', type=int, help='Worker processes; defaults to SERVER_WORKERS (0 for one per CPU).')
+@click.option('--threads', type=int, help='Request threads per worker; defaults to THREADS_PER_PAGE.')
+@click.option('--worker-class', type=click.Choice(['asyncio', 'threads']), help='Defaults to SERVER_WORKER_CLASS.')
+def serve(host, port, workers, threads, worker_class):
+    """Serve the app with pre-forked, multi-threaded or asyncio workers."""
+    from squiggy.lib.prefork import PreforkServer
+    PreforkServer.from_config(application, host=host, port=port, workers=workers, threads=threads, worker_class=worker_class).run()
+
+
+profiles = AppGroup('profiles', help='Inspect request profiles captured in PROFILING_DIR.')
+
+
+@profiles.command('list')
+@click.option('--limit', default=20, help='Number of profiles to list, newest first.')
+def list_profiles(limit):
+    from squiggy.lib.profiling import list_profiles
+    for profile in list_profiles(application.config['PROFILING_DIR'])[:limit]:
+        click.echo(f"{profile['createdAt']:%Y-%m-%d %H:%M:%S}  {profile['size']:>9,}  {profile['name']}")
+
+
+@profiles.command('show')
+@click.argument('name')
+@click.option('--sort', default='cumulative', help='pstats sort key, e.g. cumulative, tottime, ncalls.')
+@click.option('--limit', default=30, help='Number of functions to show.')
+def show_profile(name, sort, limit):
+    from squiggy.lib.profiling import summarize_profile
+    click.echo(summarize_profile(os.path.join(application.config['PROFILING_DIR'], os.path.basename(name)), sort, limit))
+
+
+application.cli.add_command(profiles)
 
 
 host = application.config['HOST']
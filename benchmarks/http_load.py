@@ -0,0 +1,242 @@
+"""
+Copyright ©2021. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import http.client
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, BASE_DIR)
+# Configs such as INDEX_HTML are relative to the project root.
+os.chdir(BASE_DIR)
+os.environ.setdefault('SQUIGGY_ENV', 'test')
+
+from flask_login.utils import _create_identifier  # noqa: E402
+from squiggy.factory import create_app  # noqa: E402
+from werkzeug.serving import make_server  # noqa: E402
+
+"""Measure latency and throughput of Squiggy endpoints over HTTP, and compare against a stored baseline.
+
+The app is built with create_app (SQUIGGY_ENV defaults to 'test', i.e. the local Postgres test database, which is
+migrated and seeded first) and served by a threaded Werkzeug server on a free local port. Baselines are specific to the
+machine that recorded them.
+
+Usage:
+
+>>> python benchmarks/http_load.py --concurrency 8 --requests 2000 --save-baseline
+>>> python benchmarks/http_load.py --concurrency 8 --requests 2000 --threshold 0.15
+"""
+
+DEFAULT_BASELINE = os.path.join(BASE_DIR, 'benchmarks', 'baselines', 'http_load.json')
+
+ENDPOINTS = {
+    'ping': '/api/ping',
+    'config': '/api/config',
+    'version': '/api/version',
+    'profile': '/api/profile/my',
+    'front_end': '/',
+}
+
+USER_AGENT = 'squiggy-benchmark'
+
+
+def session_cookie(app, uid):
+    """Sign in as 'uid' the way Flask-Login would, and return the session cookie for the benchmark client."""
+    from squiggy.models.authorized_user import AuthorizedUser
+    with app.app_context():
+        user_id = AuthorizedUser.get_id_per_uid(uid)
+    if user_id is None:
+        raise SystemExit(f'No user with uid {uid}')
+    # Flask-Login's session identifier must match the benchmark client, or the session is re-issued on every request.
+    with app.test_request_context(environ_base={'REMOTE_ADDR': '127.0.0.1'}, headers={'User-Agent': USER_AGENT}):
+        identifier = _create_identifier()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+        session['_id'] = identifier
+    for cookie in client.cookie_jar:
+        if cookie.name == app.session_cookie_name:
+            return f'{cookie.name}={cookie.value}'
+    raise SystemExit('No session cookie was issued')
+
+
+def run_endpoint(base_url, path, cookie, concurrency, requests, warmup):
+    """Issue 'requests' GETs of 'path' from 'concurrency' threads, each with its own keep-alive connection."""
+    parsed = urlsplit(base_url)
+    headers = {'Cookie': cookie, 'User-Agent': USER_AGENT, 'Accept-Encoding': 'gzip'}
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    remaining = [requests]
+
+    def _take():
+        with lock:
+            if remaining[0] <= 0:
+                return False
+            remaining[0] -= 1
+            return True
+
+    def _worker():
+        connection = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=30)
+        local_latencies = []
+        local_errors = 0
+        try:
+            while _take():
+                started_at = time.perf_counter()
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                local_latencies.append(time.perf_counter() - started_at)
+                if response.status >= 400:
+                    local_errors += 1
+        finally:
+            connection.close()
+        with lock:
+            latencies.extend(local_latencies)
+            errors.append(local_errors)
+
+    connection = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=30)
+    for _ in range(warmup):
+        connection.request('GET', path, headers=headers)
+        connection.getresponse().read()
+    connection.close()
+
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(_worker) for _ in range(concurrency)]:
+            future.result()
+    elapsed = time.perf_counter() - started_at
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'rps': len(latencies) / elapsed,
+        'p50Ms': percentile(latencies, 50) * 1000,
+        'p95Ms': percentile(latencies, 95) * 1000,
+        'p99Ms': percentile(latencies, 99) * 1000,
+    }
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def regressions(results, baseline, threshold):
+    """List endpoints whose p95 latency grew, or throughput fell, by more than 'threshold' (a fraction) of baseline."""
+    found = []
+    for name, result in results.items():
+        base = baseline.get('endpoints', {}).get(name)
+        if not base:
+            continue
+        if result['p95Ms'] > base['p95Ms'] * (1 + threshold):
+            found.append(f"{name}: p95 {result['p95Ms']:.2f} ms vs baseline {base['p95Ms']:.2f} ms")
+        if result['rps'] < base['rps'] * (1 - threshold):
+            found.append(f"{name}: {result['rps']:.0f} req/s vs baseline {base['rps']:.0f} req/s")
+        if result['errors'] > base['errors']:
+            found.append(f"{name}: {result['errors']} errors vs baseline {base['errors']}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HTTP load and latency benchmark of Squiggy endpoints.')
+    parser.add_argument('--concurrency', type=int, default=4, help='Concurrent client connections')
+    parser.add_argument('--requests', type=int, default=1000, help='Requests per endpoint')
+    parser.add_argument('--warmup', type=int, default=50, help='Unmeasured requests per endpoint, sent first')
+    parser.add_argument('--endpoints', nargs='+', choices=list(ENDPOINTS), default=list(ENDPOINTS))
+    parser.add_argument('--uid', default='2040', help='UID of the user signed in for /api/profile/my')
+    parser.add_argument('--url', help='Base URL of an already running Squiggy (same configs), rather than a local server')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Baseline JSON file')
+    parser.add_argument('--save-baseline', action='store_true', help='Write results to the baseline file')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Allowed regression, as a fraction of baseline')
+    args = parser.parse_args()
+
+    app = create_app()
+    # Per-request logging to the console would dominate what we measure.
+    app.logger.setLevel(logging.WARNING)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    with app.app_context():
+        from squiggy.models import development_db
+        development_db.load()
+    cookie = session_cookie(app, args.uid)
+
+    server = None
+    base_url = args.url
+    if not base_url:
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f'http://127.0.0.1:{server.server_port}'
+    try:
+        results = {}
+        print(f'{"endpoint":<12}{"requests":>10}{"errors":>8}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}')
+        for name in args.endpoints:
+            result = run_endpoint(base_url, ENDPOINTS[name], cookie, args.concurrency, args.requests, args.warmup)
+            results[name] = result
+            print(
+                f"{name:<12}{result['requests']:>10}{result['errors']:>8}{result['rps']:>10.0f}"
+                f"{result['p50Ms']:>10.2f}{result['p95Ms']:>10.2f}{result['p99Ms']:>10.2f}",
+            )
+    finally:
+        if server:
+            server.shutdown()
+
+    report = {
+        'concurrency': args.concurrency,
+        'requests': args.requests,
+        'endpoints': results,
+    }
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(report, baseline_file, indent=2, sort_keys=True)
+        print(f'Baseline saved to {args.baseline}')
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+        if (baseline.get('concurrency'), baseline.get('requests')) != (args.concurrency, args.requests):
+            print('Warning: baseline was recorded with different --concurrency or --requests')
+        found = regressions(results, baseline, args.threshold)
+        if found:
+            print(f'Regressions beyond {args.threshold:.0%} of baseline:')
+            for regression in found:
+                print(f'  {regression}')
+            sys.exit(1)
+        print(f'No regressions beyond {args.threshold:.0%} of baseline.')
+    else:
+        print(f'No baseline at {args.baseline}; run with --save-baseline to record one.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Copyright ©2021. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import argparse
+from datetime import datetime, timedelta
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from squiggy.lib.json_backends import get_dumps, simplejson_dumps  # noqa: E402
+
+"""Compare JSON encoder backends on payloads shaped like Squiggy API responses.
+
+Usage:
+
+>>> python benchmarks/json_encoders.py
+>>> python benchmarks/json_encoders.py --rows 20000 --repeat 5
+"""
+
+
+def user_payload(rows):
+    created_at = datetime(2021, 1, 1)
+    return [
+        {
+            'id': i,
+            'uid': str(100000 + i),
+            'canvasUserId': 9000000 + i,
+            'canvasCourseRole': random.choice(['Student', 'TA', 'Teacher']),
+            'isAdmin': i % 50 == 0,
+            'name': f'Student {i}',
+            'createdAt': (created_at + timedelta(minutes=i)).isoformat(),
+        } for i in range(rows)
+    ]
+
+
+def asset_payload(rows):
+    return [
+        {
+            'id': i,
+            'assetType': random.choice(['file', 'link', 'whiteboard']),
+            'title': f'Asset number {i} with a reasonably long title',
+            'description': 'Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * 4,
+            'url': f'https://example.berkeley.edu/assets/{i}',
+            'thumbnailUrl': f'https://example.berkeley.edu/assets/{i}/thumbnail.png',
+            'likes': random.randint(0, 500),
+            'views': random.randint(0, 5000),
+            'commentCount': random.randint(0, 40),
+            'categories': [{'id': c, 'title': f'Category {c}'} for c in range(i % 4)],
+            'users': [{'id': i + u, 'name': f'Author {u}'} for u in range(1 + i % 3)],
+        } for i in range(rows)
+    ]
+
+
+def leaderboard_payload(rows):
+    return [
+        {
+            'id': i,
+            'name': f'Student {i}',
+            'points': random.randint(0, 10000),
+            'rank': i + 1,
+            'sharePoints': i % 3 != 0,
+            'averagePoints': float('nan') if i % 97 == 0 else random.random() * 100,
+        } for i in range(rows)
+    ]
+
+
+def encoders():
+    candidates = {
+        'simplejson': simplejson_dumps,
+        # For reference only: the standard library writes NaN rather than null.
+        'json (stdlib)': lambda obj: json.dumps(obj, separators=(',', ':')),
+    }
+    orjson_dumps = get_dumps('orjson')
+    if orjson_dumps is not simplejson_dumps:
+        candidates['orjson'] = orjson_dumps
+    return candidates
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare JSON encoder backends on Squiggy-shaped payloads.')
+    parser.add_argument('--rows', type=int, default=5000, help='Rows per payload')
+    parser.add_argument('--number', type=int, default=20, help='Encodings per timing run')
+    parser.add_argument('--repeat', type=int, default=3, help='Timing runs; the best is reported')
+    args = parser.parse_args()
+
+    random.seed(0)
+    payloads = {
+        'users': user_payload(args.rows),
+        'assets': asset_payload(args.rows),
+        'leaderboard': leaderboard_payload(args.rows),
+    }
+    candidates = encoders()
+    print(f'{"payload":<14}{"encoder":<16}{"bytes":>12}{"ms/encode":>12}{"MB/s":>10}{"vs simplejson":>16}')
+    for payload_name, payload in payloads.items():
+        baseline = None
+        for encoder_name, dumps in candidates.items():
+            size = len(dumps(payload))
+            best = min(timeit.repeat(lambda: dumps(payload), number=args.number, repeat=args.repeat)) / args.number
+            if encoder_name == 'simplejson':
+                baseline = best
+            speedup = f'{baseline / best:.2f}x'
+            print(f'{payload_name:<14}{encoder_name:<16}{size:>12,}{best * 1000:>12.2f}{size / best / 1e6:>10.1f}{speedup:>16}')
+
+
+if __name__ == '__main__':
+    main()
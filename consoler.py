@@ -41,10 +41,12 @@ from pprintpp import pprint as pp # noqa
 * Click the bug icon to start a debugging session:
 
 >>> from squiggy.models.authorized_user import AuthorizedUser
->>> rows = AuthorizedUser.query.all()
->>> pp(rows)
+>>> users = AuthorizedUser.get_page(limit=10)
+>>> pp(users)
 [
-    <AuthorizedUser 2040>, ...
+    {'id': 1, 'uid': '2040', ...}, ...
+
+Use AuthorizedUser.iter_all() to walk every user; AuthorizedUser.query.all() would load every row into the session.
 
 """
 
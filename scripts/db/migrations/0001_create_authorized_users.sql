@@ -23,39 +23,21 @@
  * ENHANCEMENTS, OR MODIFICATIONS.
  */
 
-SET statement_timeout = 0;
-SET lock_timeout = 0;
-SET idle_in_transaction_session_timeout = 0;
-SET client_encoding = 'UTF8';
-SET standard_conforming_strings = on;
-SET check_function_bodies = false;
-SET client_min_messages = warning;
-SET row_security = off;
-SET search_path = public, pg_catalog;
-SET default_tablespace = '';
-SET default_with_oids = false;
-
---
-
-CREATE TABLE authorized_users (
-    id integer NOT NULL,
-    uid character varying(255) NOT NULL,
-    created_at timestamp with time zone NOT NULL,
-    updated_at timestamp with time zone NOT NULL
-);
-ALTER TABLE authorized_users OWNER TO squiggy;
-CREATE SEQUENCE authorized_users_id_seq
+CREATE SEQUENCE IF NOT EXISTS authorized_users_id_seq
     START WITH 1
     INCREMENT BY 1
     NO MINVALUE
     NO MAXVALUE
     CACHE 1;
 ALTER TABLE authorized_users_id_seq OWNER TO squiggy;
-ALTER SEQUENCE authorized_users_id_seq OWNED BY authorized_users.id;
-ALTER TABLE ONLY authorized_users ALTER COLUMN id SET DEFAULT nextval('authorized_users_id_seq'::regclass);
-ALTER TABLE ONLY authorized_users
-    ADD CONSTRAINT authorized_users_pkey PRIMARY KEY (id);
-ALTER TABLE ONLY authorized_users
-    ADD CONSTRAINT authorized_users_uid_key UNIQUE (uid);
 
---
+CREATE TABLE IF NOT EXISTS authorized_users (
+    id integer DEFAULT nextval('authorized_users_id_seq'::regclass) NOT NULL,
+    uid character varying(255) NOT NULL,
+    created_at timestamp with time zone NOT NULL,
+    updated_at timestamp with time zone NOT NULL,
+    CONSTRAINT authorized_users_pkey PRIMARY KEY (id),
+    CONSTRAINT authorized_users_uid_key UNIQUE (uid)
+);
+ALTER TABLE authorized_users OWNER TO squiggy;
+ALTER SEQUENCE authorized_users_id_seq OWNED BY authorized_users.id;
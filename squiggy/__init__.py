@@ -26,9 +26,12 @@ ENHANCEMENTS, OR MODIFICATIONS.
 from flask import current_app as app
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.exc import SQLAlchemyError
+from squiggy.lib import request_scope
 
 __version__ = '3.0'
 
+# The session registry copies the context stacks' key function when created.
+request_scope.install()
 db = SQLAlchemy()
 
 
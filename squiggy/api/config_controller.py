@@ -27,10 +27,12 @@ import json
 
 from flask import current_app as app
 from squiggy import __version__ as version
-from squiggy.lib.http import tolerant_jsonify
+from squiggy.lib.file_cache import FileCache
+from squiggy.lib.http import conditional_response, tolerant_jsonify
 
 
 @app.route('/api/config')
+@conditional_response(static=True)
 def app_config():
     return tolerant_jsonify({
         'squiggyEnv': app.config['SQUIGGY_ENV'],
@@ -39,7 +41,9 @@ def app_config():
     })
 
 
+# The build summary can be replaced by a hot deploy, so its ETag is computed per response.
 @app.route('/api/version')
+@conditional_response()
 def app_version():
     v = {
         'version': version,
@@ -56,7 +60,12 @@ def app_version():
 
 def load_json(relative_path):
     try:
-        file = open(app.config['BASE_DIR'] + '/' + relative_path)
-        return json.load(file)
+        path = app.config['BASE_DIR'] + '/' + relative_path
+        if path not in _json_caches:
+            _json_caches[path] = FileCache(path, json.loads, app.config['FILE_CACHE_CHECK_INTERVAL'], missing_ok=True)
+        return _json_caches[path].get()
     except (FileNotFoundError, KeyError, TypeError):
         return None
+
+
+_json_caches = {}
@@ -23,37 +23,54 @@ SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
 ENHANCEMENTS, OR MODIFICATIONS.
 """
 
+from functools import wraps
+
 from flask import current_app as app
 import squiggy.api.errors
+from squiggy.lib import metrics
 from squiggy.lib.http import tolerant_jsonify
 
 
+def _counted(handler):
+    @wraps(handler)
+    def _counted_handler(error):
+        metrics.count_error(handler.__name__)
+        return handler(error)
+    return _counted_handler
+
+
 @app.errorhandler(squiggy.api.errors.BadRequestError)
+@_counted
 def handle_bad_request(error):
     return error.to_json(), 400
 
 
 @app.errorhandler(squiggy.api.errors.UnauthorizedRequestError)
+@_counted
 def handle_unauthorized(error):
     return error.to_json(), 401
 
 
 @app.errorhandler(squiggy.api.errors.ForbiddenRequestError)
+@_counted
 def handle_forbidden(error):
     return error.to_json(), 403
 
 
 @app.errorhandler(squiggy.api.errors.ResourceNotFoundError)
+@_counted
 def handle_resource_not_found(error):
     return error.to_json(), 404
 
 
 @app.errorhandler(squiggy.api.errors.InternalServerError)
+@_counted
 def handle_internal_server_error(error):
     return error.to_json(), 500
 
 
 @app.errorhandler(Exception)
+@_counted
 def handle_unexpected_error(error):
     app.logger.exception(error)
     return tolerant_jsonify({'message': 'An unexpected server error occurred.'}), 500
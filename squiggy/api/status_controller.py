@@ -23,24 +23,89 @@ SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
 ENHANCEMENTS, OR MODIFICATIONS.
 """
 
-from flask import current_app as app
-from sqlalchemy.exc import SQLAlchemyError
+import hmac
+
+from flask import current_app as app, request, Response
 from squiggy import db
+from squiggy.api.api_util import admin_required
+from squiggy.api.errors import UnauthorizedRequestError
+from squiggy.lib import compression, metrics
+from squiggy.lib.db_pool import pool_status
+from squiggy.lib.health import database_health
 from squiggy.lib.http import tolerant_jsonify
+from squiggy.models.authorized_user import user_cache
 
 
 @app.route('/api/ping')
 def app_status():
-    def db_status():
-        try:
-            db.session.execute('SELECT 1')
-            return True
-        except SQLAlchemyError:
-            app.logger.exception('Database connection error')
-            return False
-
     resp = {
         'app': True,
-        'db': db_status(),
+        'db': database_health(app).status(),
     }
     return tolerant_jsonify(resp)
+
+
+@app.route('/api/live')
+def app_liveness():
+    # The process is up and serving requests. No dependencies are checked.
+    return tolerant_jsonify({'app': True})
+
+
+@app.route('/api/ready')
+def app_readiness():
+    db_ready = database_health(app).status()
+    return tolerant_jsonify({'app': True, 'db': db_ready}, status=200 if db_ready else 503)
+
+
+@app.route('/api/admin/db_pool')
+@admin_required
+def db_pool_status():
+    return tolerant_jsonify({
+        **pool_status(db.engine),
+        'transactionPoolerMode': app.config['DB_TRANSACTION_POOLER_MODE'],
+    })
+
+
+@app.route('/api/metrics')
+def app_metrics():
+    # Metrics reveal traffic and internals, so scraping requires the configured token; with none, nobody may scrape.
+    token = app.config['METRICS_AUTH_TOKEN']
+    authorization = request.headers.get('Authorization', '')
+    if not token or not hmac.compare_digest(authorization.encode('utf-8'), f'Bearer {token}'.encode('utf-8')):
+        raise UnauthorizedRequestError('Invalid metrics token.')
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+def _process_metrics():
+    gauges = {}
+    counters = {}
+    pool_stats = getattr(db.engine.pool, 'stats', None)
+    if pool_stats:
+        stats = pool_stats()
+        gauges.update({
+            'squiggy_db_pool_size': stats['size'],
+            'squiggy_db_pool_checked_in': stats['checkedIn'],
+            'squiggy_db_pool_checked_out': stats['checkedOut'],
+            'squiggy_db_pool_overflow': stats['overflow'],
+        })
+        counters.update({
+            'squiggy_db_pool_checkouts_total': stats['checkouts'],
+            'squiggy_db_pool_waits_total': stats['waits'],
+            'squiggy_db_pool_wait_seconds_total': stats['waitSeconds'],
+        })
+    user_cache_stats = user_cache().stats()
+    gauges['squiggy_user_cache_size'] = user_cache_stats['size']
+    counters.update({
+        'squiggy_user_cache_hits_total': user_cache_stats['hits'],
+        'squiggy_user_cache_misses_total': user_cache_stats['misses'],
+    })
+    compression_stats = compression.stats.to_api_json()
+    counters.update({
+        'squiggy_api_compression_responses_total': compression_stats['responsesCompressed'],
+        'squiggy_api_compression_bytes_in_total': compression_stats['bytesIn'],
+        'squiggy_api_compression_bytes_out_total': compression_stats['bytesOut'],
+    })
+    return gauges, counters
+
+
+metrics.register_collector(_process_metrics)
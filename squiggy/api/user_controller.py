@@ -23,11 +23,37 @@ SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
 ENHANCEMENTS, OR MODIFICATIONS.
 """
 
-from flask import current_app as app
+from flask import current_app as app, request
 from flask_login import current_user
-from squiggy.lib.http import tolerant_jsonify
+from squiggy.api.api_util import admin_required
+from squiggy.api.errors import BadRequestError
+from squiggy.lib.http import tolerant_jsonify, tolerant_jsonify_stream
+from squiggy.models.authorized_user import AuthorizedUser
 
 
 @app.route('/api/profile/my')
 def my_profile():
     return tolerant_jsonify(current_user.to_api_json())
+
+
+@app.route('/api/users')
+@admin_required
+def get_users():
+    after_id = _get_int_param('after', minimum=0)
+    if request.args.get('stream', '').lower() == 'true':
+        return tolerant_jsonify_stream(AuthorizedUser.iter_all(after_id=after_id, batch_size=app.config['USERS_PAGE_SIZE_MAX']))
+    limit = min(_get_int_param('limit') or app.config['USERS_PAGE_SIZE'], app.config['USERS_PAGE_SIZE_MAX'])
+    users = AuthorizedUser.get_page(after_id=after_id, limit=limit)
+    return tolerant_jsonify({
+        'users': users,
+        'nextAfter': users[-1]['id'] if len(users) == limit else None,
+    })
+
+
+def _get_int_param(name, minimum=1):
+    value = request.args.get(name)
+    if value is None:
+        return None
+    if not value.isdigit() or int(value) < minimum:
+        raise BadRequestError(f'Invalid \'{name}\': {value}')
+    return int(value)
@@ -25,6 +25,9 @@ ENHANCEMENTS, OR MODIFICATIONS.
 
 import importlib.util
 import os
+import re
+import shlex
+import subprocess
 
 
 def load_configs(app):
@@ -55,3 +58,47 @@ def load_local_config(app, config_name):
     configs_location = os.environ.get('SQUIGGY_LOCAL_CONFIGS') or '../config'
     config_path = configs_location + '/' + config_name
     app.config.from_pyfile(config_path, silent=True)
+
+
+def load_env_file(path):
+    """Export the variables in a shell env file, such as Elastic Beanstalk's /opt/python/current/env, to os.environ.
+
+    A file of plain (optionally quoted) 'export KEY=value' assignments is parsed directly. Anything else, such as
+    '$' expansion or commands, is left to bash, which sources the file in a subprocess.
+    """
+    try:
+        with open(path, 'r') as env_file:
+            content = env_file.read()
+    except OSError:
+        return
+    variables = _parse_env_file(content)
+    if variables is None:
+        variables = _source_env_file(path)
+    os.environ.update(variables)
+
+
+_ENV_ASSIGNMENT = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*=')
+
+
+def _parse_env_file(content):
+    if '$' in content or '`' in content or '\\' in content:
+        return None
+    try:
+        tokens = shlex.split(content, comments=True)
+    except ValueError:
+        return None
+    variables = {}
+    for token in tokens:
+        if token == 'export':
+            continue
+        if not _ENV_ASSIGNMENT.match(token):
+            return None
+        key, _, value = token.partition('=')
+        variables[key] = value
+    return variables
+
+
+def _source_env_file(path):
+    command = ['bash', '-c', f'{{ source {shlex.quote(path)} || true; }} && env -0']
+    output = subprocess.run(command, stdout=subprocess.PIPE, check=False).stdout.decode('utf-8')
+    return dict(line.partition('=')[::2] for line in output.split('\0') if '=' in line)
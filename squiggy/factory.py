@@ -24,20 +24,42 @@ ENHANCEMENTS, OR MODIFICATIONS.
 """
 
 from flask import Flask
+from flask_login import LoginManager
 from squiggy import db
 from squiggy.configs import load_configs
+from squiggy.lib.db_pool import configure_engine, engine_options, warm_pool
+from squiggy.lib.startup import StartupTimer
 from squiggy.logger import initialize_logger
+from squiggy.models.authorized_user import AuthorizedUser
 from squiggy.routes import register_routes
 
 
-def create_app():
-    """Initialize app with configs."""
+def create_app(config_overrides=None):
+    """Initialize app with configs, then any 'config_overrides' (e.g., a test worker's database)."""
+    timer = StartupTimer()
     app = Flask(__name__.split('.')[0])
-    load_configs(app)
-    initialize_logger(app)
-    db.init_app(app)
+    app.extensions['squiggy_startup_timer'] = timer
+    with timer.phase('load_configs'):
+        load_configs(app)
+        app.config.update(config_overrides or {})
+    with timer.phase('initialize_logger'):
+        initialize_logger(app)
+    with timer.phase('init_extensions'):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app)
+        db.init_app(app)
+
+        login_manager = LoginManager()
+        login_manager.user_loader(AuthorizedUser.find_by_id)
+        login_manager.init_app(app)
 
     with app.app_context():
-        register_routes(app)
+        with timer.phase('configure_engine'):
+            configure_engine(app, db.engine)
+            warm_pool(app, db.engine)
+        with timer.phase('register_routes'):
+            register_routes(app)
 
+    del app.extensions['squiggy_startup_timer']
+    app.extensions['squiggy_startup_timings'] = timer.to_api_json()
+    app.logger.info(f'App created in {timer.total() * 1000:.0f} ms')
     return app
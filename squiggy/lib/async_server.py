@@ -0,0 +1,374 @@
+"""
+Copyright ©2021. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from email.utils import formatdate
+from http import HTTPStatus
+import io
+import socket
+import sys
+from urllib.parse import unquote_to_bytes, urlsplit
+
+from flask import request_started
+from squiggy.lib.async_views import defer_async_views, PendingView, release_connection
+from squiggy.lib.profiling import stop_profiling
+from squiggy.lib.request_scope import request_scope
+
+"""An asyncio HTTP/1.1 server, the 'asyncio' worker class of the prefork server, for holding many slow requests at once.
+
+Connections are accepted, read and written on an event loop, so an idle keep-alive connection, or a slow client,
+costs no thread. Each request's sync work (the app's before- and after-request hooks, sync views, error handlers)
+runs on a pool of THREADS_PER_PAGE threads, while a view decorated with async_view is awaited on the loop itself: a
+request waiting on I/O in an async view holds no thread either. Throughout, Flask's context locals are keyed by
+request scope (see request_scope.py), so the request follows its work from thread to loop and back.
+
+Request bodies must have a Content-Length; chunked uploads get 411 Length Required. _begin and _finish follow
+Flask.wsgi_app of Flask 1.1, and must be compared with it again on any upgrade of Flask.
+"""
+
+# Seconds that an idle keep-alive connection is kept open, waiting for its next request.
+KEEPALIVE_TIMEOUT = 5
+# Longest request line plus headers, in bytes.
+MAX_HEADER_SIZE = 65536
+
+_END_OF_STREAM = object()
+
+
+class AsyncWSGIServer:
+
+    def __init__(self, host, app, fd, threads, max_requests=0):
+        if 'wsgi_app' in vars(app):
+            # _begin and _finish stand in for Flask.wsgi_app, so that middleware wrapping it would never run.
+            raise ValueError('The asyncio worker class cannot serve an app whose wsgi_app is wrapped in middleware.')
+        self.host = host
+        self.app = app
+        self.socket = socket.fromfd(fd, socket.AF_INET, socket.SOCK_STREAM)
+        self.port = self.socket.getsockname()[1]
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='squiggy-request')
+        self.max_requests = max_requests
+        self.requests = 0
+        self._connections = set()
+        self._idle_writers = set()
+        self._loop = None
+        self._stopped = None
+        self._stopping = False
+
+    def serve(self):
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self._serve())
+        finally:
+            # Let in-flight requests finish.
+            self.executor.shutdown(wait=True)
+            loop.close()
+            self.socket.close()
+
+    def stop(self):
+        # Called from a signal handler, a request or another thread.
+        self._stopping = True
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+
+    async def _serve(self):
+        self._stopped = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        if self._stopping:
+            self._stopped.set()
+        server = await asyncio.start_server(self._handle_connection, sock=self.socket, limit=MAX_HEADER_SIZE)
+        await self._stopped.wait()
+        server.close()
+        # A connection waiting for its next request then reads the end of the stream, and its handler returns.
+        for writer in self._idle_writers:
+            writer.close()
+        if self._connections:
+            await asyncio.wait(self._connections)
+        await server.wait_closed()
+
+    async def _handle_connection(self, reader, writer):
+        defer_async_views()
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            keep_alive = True
+            while keep_alive and not self._stopping:
+                self._idle_writers.add(writer)
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), KEEPALIVE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    return
+                except asyncio.LimitOverrunError:
+                    await _write_error(writer, HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+                    return
+                finally:
+                    self._idle_writers.discard(writer)
+                keep_alive = await self._handle_request(head, reader, writer)
+        except ConnectionError:
+            pass
+        except Exception:
+            # E.g., a streamed response failed partway. Closing the connection tells the client it is incomplete.
+            self.app.logger.exception('Failed to write response')
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def _handle_request(self, head, reader, writer):
+        try:
+            environ = self._environ(head, writer.get_extra_info('peername') or ('', 0))
+            content_length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            await _write_error(writer, HTTPStatus.BAD_REQUEST)
+            return False
+        if 'chunked' in environ.get('HTTP_TRANSFER_ENCODING', '').lower():
+            await _write_error(writer, HTTPStatus.LENGTH_REQUIRED)
+            return False
+        max_content_length = self.app.config['MAX_CONTENT_LENGTH']
+        if content_length < 0 or (max_content_length and content_length > max_content_length):
+            await _write_error(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+            return False
+        if content_length and environ.get('HTTP_EXPECT', '').lower() == '100-continue':
+            writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+        try:
+            body = await reader.readexactly(content_length) if content_length else b''
+        except asyncio.IncompleteReadError:
+            return False
+        environ['wsgi.input'] = io.BytesIO(body)
+
+        connection = environ.get('HTTP_CONNECTION', '').lower()
+        if environ['SERVER_PROTOCOL'] == 'HTTP/1.1':
+            keep_alive = 'close' not in connection
+        else:
+            keep_alive = 'keep-alive' in connection
+
+        self.requests += 1
+        if self.requests == self.max_requests:
+            self.stop()
+        with request_scope():
+            try:
+                status, headers, body, streamed = await self._respond(environ)
+            except Exception:
+                self.app.logger.exception('Failed to handle request')
+                await _write_error(writer, HTTPStatus.INTERNAL_SERVER_ERROR)
+                return False
+            # A server stopped, even while this request was in progress, closes connections once their request is done.
+            keep_alive = keep_alive and not self._stopping
+            return await self._write_response(writer, environ, status, headers, body, streamed, keep_alive)
+
+    async def _respond(self, environ):
+        result = await self._run(_begin, self.app, environ)
+        if not isinstance(result, _Pending):
+            return result
+        value = error = None
+        try:
+            value = await result.coroutine
+        except BaseException as e:
+            error = e
+        return await self._run(_finish, self.app, result, value, error)
+
+    async def _write_response(self, writer, environ, status, headers, body, streamed, keep_alive):
+        names = {name.lower() for name, _ in headers}
+        lines = [f'HTTP/1.1 {status}']
+        lines.extend(f'{name}: {value}' for name, value in headers)
+        if 'date' not in names:
+            lines.append(f'Date: {formatdate(usegmt=True)}')
+        chunked = False
+        if 'content-length' not in names:
+            if not streamed:
+                if int(status[:3]) not in (204, 304):
+                    lines.append(f'Content-Length: {len(body)}')
+            elif environ['SERVER_PROTOCOL'] == 'HTTP/1.1':
+                chunked = True
+                lines.append('Transfer-Encoding: chunked')
+            else:
+                # An HTTP/1.0 client reads a stream of unknown length to the end of the connection.
+                keep_alive = False
+        if not keep_alive:
+            lines.append('Connection: close')
+        elif environ['SERVER_PROTOCOL'] != 'HTTP/1.1':
+            lines.append('Connection: keep-alive')
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        if streamed:
+            await self._write_stream(writer, body, chunked)
+        else:
+            writer.write(body)
+            await writer.drain()
+        return keep_alive
+
+    async def _write_stream(self, writer, app_iter, chunked):
+        iterator = iter(app_iter)
+        try:
+            while True:
+                # The stream may well query the database, so it is read on a request thread.
+                chunk = await self._run(next, iterator, _END_OF_STREAM)
+                if chunk is _END_OF_STREAM:
+                    break
+                if chunk:
+                    writer.write(b'%x\r\n%s\r\n' % (len(chunk), chunk) if chunked else chunk)
+                    await writer.drain()
+            if chunked:
+                writer.write(b'0\r\n\r\n')
+                await writer.drain()
+        finally:
+            if hasattr(app_iter, 'close'):
+                await self._run(app_iter.close)
+
+    def _environ(self, head, peer):
+        request_line, *header_lines = head.decode('latin-1').split('\r\n')
+        method, target, protocol = request_line.split(' ')
+        if protocol not in ('HTTP/1.0', 'HTTP/1.1'):
+            raise ValueError(f'Unsupported protocol {protocol}')
+        if target.startswith(('http://', 'https://')):
+            target = urlsplit(target)._replace(scheme='', netloc='').geturl()
+        path, _, query = target.partition('?')
+        environ = {
+            'REQUEST_METHOD': method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': unquote_to_bytes(path).decode('latin-1'),
+            'QUERY_STRING': query,
+            'REQUEST_URI': target,
+            'RAW_URI': target,
+            'SERVER_NAME': self.host,
+            'SERVER_PORT': str(self.port),
+            'SERVER_PROTOCOL': protocol,
+            'REMOTE_ADDR': peer[0],
+            'REMOTE_PORT': str(peer[1]),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        for line in header_lines:
+            if not line:
+                continue
+            name, separator, value = line.partition(':')
+            if not separator or name != name.strip():
+                raise ValueError(f'Malformed header: {line}')
+            # As in other servers, headers whose names contain '_' are dropped: they would be confused with '-'.
+            if '_' in name:
+                continue
+            key = name.upper().replace('-', '_')
+            if key not in ('CONTENT_LENGTH', 'CONTENT_TYPE'):
+                key = f'HTTP_{key}'
+            value = value.strip()
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+        return environ
+
+    def _run(self, func, *args):
+        # Run on a request thread, in a copy of this context and so within the request's scope.
+        return asyncio.get_running_loop().run_in_executor(self.executor, copy_context().run, func, *args)
+
+
+class _Pending:
+
+    def __init__(self, ctx, environ, coroutine):
+        self.ctx = ctx
+        self.environ = environ
+        self.coroutine = coroutine
+
+
+def _begin(app, environ):
+    # As Flask.wsgi_app, but an async view's coroutine is handed back, with its request context still pushed.
+    ctx = app.request_context(environ)
+    error = None
+    pending = None
+    try:
+        try:
+            ctx.push()
+            app.try_trigger_before_first_request_functions()
+            try:
+                request_started.send(app)
+                rv = app.preprocess_request()
+                if rv is None:
+                    rv = app.dispatch_request()
+            except Exception as e:
+                rv = app.handle_user_exception(e)
+            if isinstance(rv, PendingView):
+                # A profiler covers only the thread that started it, and the view will not run here.
+                stop_profiling(app)
+                # Nor may a connection checked out by before-request hooks (e.g., loading current_user) be held while
+                # the view is awaited.
+                release_connection()
+                pending = _Pending(ctx, environ, rv.coroutine)
+                return pending
+            response = app.finalize_request(rv)
+        except Exception as e:
+            error = e
+            response = app.handle_exception(e)
+        except:  # noqa: E722
+            error = sys.exc_info()[1]
+            raise
+        return _start_response(response, environ)
+    finally:
+        if pending is None:
+            _pop(app, ctx, error)
+
+
+def _finish(app, pending, value, view_error):
+    error = None
+    try:
+        try:
+            try:
+                if view_error is not None:
+                    raise view_error
+                rv = value
+            except Exception as e:
+                rv = app.handle_user_exception(e)
+            response = app.finalize_request(rv)
+        except Exception as e:
+            error = e
+            response = app.handle_exception(e)
+        except:  # noqa: E722
+            error = sys.exc_info()[1]
+            raise
+        return _start_response(response, pending.environ)
+    finally:
+        _pop(app, pending.ctx, error)
+
+
+def _start_response(response, environ):
+    started = []
+    app_iter = response(environ, lambda status, headers, exc_info=None: started.extend((status, headers)))
+    status, headers = started
+    if response.is_streamed:
+        return status, headers, app_iter, True
+    try:
+        return status, headers, b''.join(app_iter), False
+    finally:
+        if hasattr(app_iter, 'close'):
+            app_iter.close()
+
+
+def _pop(app, ctx, error):
+    if app.should_ignore_error(error):
+        error = None
+    ctx.auto_pop(error)
+
+
+async def _write_error(writer, status):
+    writer.write(f'HTTP/1.1 {status.value} {status.phrase}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n'.encode('latin-1'))
+    await writer.drain()
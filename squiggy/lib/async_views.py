@@ -0,0 +1,161 @@
+"""
+Copyright ©2021. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from functools import partial, wraps
+import os
+import threading
+import weakref
+
+from flask import current_app as app, g, has_app_context
+from squiggy import db, std_commit
+from squiggy.lib.request_scope import current_scope, request_scope
+
+"""Controllers written as coroutines.
+
+Decorate an 'async def' view with async_view (below the route decorator) and it can await concurrent I/O, e.g. several
+Canvas API calls at once with asyncio.gather. The request and app contexts, current_user, tolerant_jsonify and the
+error handlers all work as they do in sync views.
+
+Served by the asyncio worker of the prefork server ('flask serve --worker-class asyncio'; see async_server.py), the
+coroutine is awaited on the worker's event loop, and a request waiting in it holds no thread. Any decorators between
+the route and async_view must then pass the view's return value through unchanged. Under a WSGI server the coroutine
+runs to completion on an event loop belonging to the request's thread, as in Flask 2's async views.
+
+Blocking calls (SQLAlchemy queries, boto3, requests) are awaited with run_sync, which runs them on a pool of
+ASYNC_BLOCKING_THREADS threads within the request's context: they use the request's DB session, and their SQL counts
+against its query budget. A request's run_sync calls run one at a time, so that they never share its session at once;
+the coroutine itself must not use db.session while a run_sync call is pending.
+
+A request awaiting I/O must not hold a pooled DB connection, or the pool (not the event loop) would limit how many
+requests can wait at once. So each run_sync call is its own transaction: once the call returns, the session commits
+(with std_commit) or, if the call raised, rolls back, and its connection goes back to the pool. Objects that the call
+loaded stay in the session, unexpired, for the coroutine to read.
+"""
+
+_on_event_loop = ContextVar('squiggy_on_event_loop', default=False)
+
+
+class PendingView:
+    """Returned, in place of a response, by an async view to be awaited on the server's event loop."""
+
+    def __init__(self, coroutine):
+        self.coroutine = coroutine
+
+
+def async_view(view):
+    @wraps(view)
+    def _async_view(*args, **kwargs):
+        coroutine = view(*args, **kwargs)
+        if _on_event_loop.get():
+            return PendingView(coroutine)
+        return run_coroutine(coroutine)
+    return _async_view
+
+
+def defer_async_views():
+    """From here on in this context, have async views return a PendingView for the caller to await."""
+    _on_event_loop.set(True)
+
+
+def run_coroutine(coroutine):
+    """Run a coroutine to completion on this thread's event loop, then cancel any tasks it left behind."""
+    loop = _thread_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        pending = asyncio.all_tasks(loop)
+        for task in pending:
+            task.cancel()
+        if pending:
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+
+
+async def run_sync(func, *args, **kwargs):
+    """Await a blocking call, run on the ASYNC_BLOCKING_THREADS pool within the current request's (or app's) context."""
+    call = partial(func, *args, **kwargs)
+    if not has_app_context():
+        return await asyncio.get_running_loop().run_in_executor(None, call)
+    scope = current_scope()
+
+    def _call():
+        with request_scope(scope):
+            try:
+                result = call()
+            except BaseException:
+                db.session.rollback()
+                raise
+            release_connection()
+            return result
+
+    if 'squiggy_run_sync_lock' not in g:
+        g.squiggy_run_sync_lock = asyncio.Lock()
+    async with g.squiggy_run_sync_lock:
+        return await asyncio.get_running_loop().run_in_executor(_executor(app._get_current_object()), _call)
+
+
+def release_connection():
+    """Commit the request's DB session, without expiring what it loaded, so that it holds no pooled connection."""
+    session = db.session()
+    expire_on_commit = session.expire_on_commit
+    session.expire_on_commit = False
+    try:
+        std_commit()
+    finally:
+        session.expire_on_commit = expire_on_commit
+
+
+_executor_lock = threading.Lock()
+_local = threading.local()
+
+
+class _Owner:
+    """Referenced only from its thread's local storage, and so collected as soon as the thread exits."""
+
+    __slots__ = ('__weakref__',)
+
+
+def _thread_loop():
+    loop = getattr(_local, 'loop', None)
+    if loop is None or loop.is_closed():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        # Close the loop, and with it its selector and self-pipe, when its thread exits.
+        _local.owner = _Owner()
+        weakref.finalize(_local.owner, loop.close)
+        _local.loop = loop
+    return loop
+
+
+def _executor(_app):
+    # Threads do not survive a fork, so each worker process gets its own pool.
+    with _executor_lock:
+        pid, executor = _app.extensions.get('squiggy_async_executor', (None, None))
+        if pid != os.getpid():
+            executor = ThreadPoolExecutor(max_workers=_app.config['ASYNC_BLOCKING_THREADS'], thread_name_prefix='squiggy-blocking')
+            _app.extensions['squiggy_async_executor'] = (os.getpid(), executor)
+        return executor
@@ -0,0 +1,93 @@
+"""
+Copyright ©2021. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import gzip
+import threading
+
+from flask import request
+
+"""Opt-in gzip compression of API responses, applied in the after-request hook."""
+
+
+class CompressionStats:
+    """Running totals, shared by all request threads of a process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.responses_compressed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def record(self, bytes_in, bytes_out):
+        with self._lock:
+            self.responses_compressed += 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+
+    def to_api_json(self):
+        with self._lock:
+            return {
+                'responsesCompressed': self.responses_compressed,
+                'bytesIn': self.bytes_in,
+                'bytesOut': self.bytes_out,
+                'bytesSaved': self.bytes_in - self.bytes_out,
+            }
+
+
+stats = CompressionStats()
+
+
+def compress_response(app, response):
+    """Gzip the response body in place if configured, worthwhile and acceptable to the client."""
+    if not _is_compressible(app, response):
+        return response
+    # Whether or not this client gets gzip, the representation depends on Accept-Encoding; shared caches must know.
+    response.vary.add('Accept-Encoding')
+    if not request.accept_encodings['gzip']:
+        return response
+    data = response.get_data()
+    compressed = gzip.compress(data, compresslevel=app.config['API_COMPRESSION_LEVEL'])
+    if len(compressed) >= len(data):
+        return response
+    response.set_data(compressed)
+    response.content_encoding = 'gzip'
+    # The compressed body is not byte-for-byte identical to the original, so a strong validator becomes weak.
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    stats.record(len(data), len(compressed))
+    return response
+
+
+def _is_compressible(app, response):
+    return (
+        app.config['API_COMPRESSION_ENABLED']
+        and response.status_code == 200
+        and not response.is_streamed
+        and not response.direct_passthrough
+        and 'Content-Encoding' not in response.headers
+        and response.mimetype in app.config['API_COMPRESSION_MIMETYPES']
+        and (response.content_length or 0) >= app.config['API_COMPRESSION_MIN_SIZE']
+    )
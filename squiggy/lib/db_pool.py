@@ -0,0 +1,146 @@
+"""
+Copyright ©2021. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.pool import NullPool, QueuePool
+from squiggy.lib.startup import start_background_task
+
+
+def engine_options(app):
+    """Build SQLAlchemy create_engine options from the DB_* configs, over any SQLALCHEMY_ENGINE_OPTIONS.
+
+    In transaction-pooler mode (PgBouncer with pool_mode=transaction), connection pooling is left to the pooler, and no
+    session state is set at connect time: a server connection may serve other clients between our transactions.
+    """
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    connect_args = dict(options.get('connect_args') or {})
+    connect_args.setdefault('application_name', app.config['DB_APPLICATION_NAME'])
+    if app.config['DB_TRANSACTION_POOLER_MODE']:
+        options.setdefault('poolclass', NullPool)
+    else:
+        options.setdefault('poolclass', InstrumentedQueuePool)
+        options.setdefault('pool_size', app.config['DB_POOL_SIZE'])
+        options.setdefault('max_overflow', app.config['DB_POOL_MAX_OVERFLOW'])
+        options.setdefault('pool_timeout', app.config['DB_POOL_TIMEOUT'])
+        options.setdefault('pool_recycle', app.config['DB_POOL_RECYCLE'])
+        statement_timeout = app.config['DB_STATEMENT_TIMEOUT_MS']
+        if statement_timeout:
+            connect_args.setdefault('options', f'-c statement_timeout={int(statement_timeout)}')
+    options.setdefault('pool_pre_ping', app.config['DB_POOL_PRE_PING'])
+    options['connect_args'] = connect_args
+    return options
+
+
+def configure_engine(app, engine):
+    """In transaction-pooler mode, apply the statement timeout per transaction rather than per connection."""
+    statement_timeout = app.config['DB_STATEMENT_TIMEOUT_MS']
+    if app.config['DB_TRANSACTION_POOLER_MODE'] and statement_timeout:
+        sql = f'SET LOCAL statement_timeout = {int(statement_timeout)}'
+
+        @event.listens_for(engine, 'begin')
+        def _set_local_statement_timeout(conn):
+            cursor = conn.connection.cursor()
+            try:
+                cursor.execute(sql)
+            finally:
+                cursor.close()
+
+
+def warm_pool(app, engine):
+    """Open DB_POOL_WARM_CONNECTIONS pooled connections on a background thread, so first requests need not wait."""
+    count = min(app.config['DB_POOL_WARM_CONNECTIONS'], app.config['DB_POOL_SIZE'])
+    if count < 1 or not isinstance(engine.pool, QueuePool):
+        return None
+    logger = app.logger
+
+    def _warm():
+        connections = []
+        try:
+            for _ in range(count):
+                connections.append(engine.connect())
+        except Exception as e:
+            logger.warning(f'Failed to warm DB connection pool: {e}')
+        finally:
+            # Returned connections stay open in the pool.
+            for connection in connections:
+                connection.close()
+
+    return start_background_task(app, 'squiggy-db-pool-warmer', _warm)
+
+
+def pool_status(engine):
+    pool = engine.pool
+    status = {
+        'poolClass': type(pool).__name__,
+    }
+    if isinstance(pool, InstrumentedQueuePool):
+        stats = pool.stats()
+        capacity = stats['size'] + max(pool._max_overflow, 0)
+        status.update(stats)
+        status.update({
+            'maxOverflow': pool._max_overflow,
+            'timeout': pool._timeout,
+            'utilization': stats['checkedOut'] / capacity if capacity else None,
+        })
+    return status
+
+
+class InstrumentedQueuePool(QueuePool):
+    """A QueuePool that counts checkouts, and checkouts that had to wait for a connection to be returned."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    def _do_get(self):
+        # The pool is exhausted if no idle connection is available and overflow is at its limit.
+        exhausted = self.checkedin() == 0 and -1 < self._max_overflow <= self.overflow()
+        started_at = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            with self._stats_lock:
+                self.checkouts += 1
+                if exhausted:
+                    self.waits += 1
+                    self.wait_seconds += time.perf_counter() - started_at
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'size': self.size(),
+                'checkedIn': self.checkedin(),
+                'checkedOut': self.checkedout(),
+                'overflow': max(self.overflow(), 0),
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'waitSeconds': self.wait_seconds,
+            }
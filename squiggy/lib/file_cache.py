@@ -0,0 +1,81 @@
+"""
+Copyright ©2021. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import os
+import threading
+import time
+
+
+class FileCache:
+    """Parse a file once and serve the result from memory, picking up changes on disk.
+
+    At most once per 'check_interval' seconds, a 'get' call stats the file; if its mtime or size has changed then the
+    file is re-read and passed through 'loader', and the new value replaces the old one in a single assignment.
+    Concurrent readers therefore see either the old value or the new one, never a partial reload. If a reload fails
+    (e.g., a build is half-written) the last good value is served and the reload is retried at the next check.
+    """
+
+    def __init__(self, path, loader, check_interval=2, missing_ok=False):
+        self.path = path
+        self.loader = loader
+        self.check_interval = check_interval
+        self.missing_ok = missing_ok
+        self._lock = threading.Lock()
+        # (file stamp, loaded value, monotonic time of last check); replaced wholesale, never mutated.
+        self._state = None
+
+    def get(self):
+        state = self._state
+        if state is not None and time.monotonic() - state[2] < self.check_interval:
+            return state[1]
+        with self._lock:
+            if self._state is not state:
+                # Another thread revalidated while we waited.
+                return self._state[1]
+            self._state = self._revalidate(state)
+            return self._state[1]
+
+    def _revalidate(self, state):
+        now = time.monotonic()
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            if self.missing_ok:
+                return None, None, now
+            if state is None:
+                raise
+            return None, state[1], now
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if state is not None and state[0] == stamp:
+            return stamp, state[1], now
+        try:
+            with open(self.path, 'rb') as file:
+                value = self.loader(file.read())
+        except Exception:
+            if state is None:
+                raise
+            # Keep serving the previous value; a stamp of None forces a reload attempt at the next check.
+            return None, state[1], now
+        return stamp, value, now
@@ -0,0 +1,101 @@
+"""
+Copyright ©2021. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import threading
+import time
+
+from sqlalchemy import text
+from squiggy import db
+
+
+class CachedHealthCheck:
+    """Run a health check at most once per 'ttl' seconds, in the background, with a hard timeout.
+
+    Callers get the most recent result immediately while a stale result is refreshed on a background thread, so any
+    number of probes cost at most one check per interval. Only the very first call waits for a result, and then for
+    no longer than 'timeout' seconds. A check that has not returned within 'timeout' seconds counts as a failure.
+    """
+
+    def __init__(self, check, ttl, timeout):
+        self.check = check
+        self.ttl = ttl
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._result = None
+        self._checked_at = None
+        self._running_since = None
+        self._done = threading.Event()
+
+    def status(self):
+        now = time.monotonic()
+        with self._lock:
+            stale = self._checked_at is None or now - self._checked_at >= self.ttl
+            if stale and self._running_since is None:
+                self._running_since = now
+                self._done = threading.Event()
+                threading.Thread(target=self._run, name='squiggy-health-check', daemon=True).start()
+            done = self._done
+        if self._checked_at is None:
+            done.wait(self.timeout)
+        with self._lock:
+            if self._running_since is not None and time.monotonic() - self._running_since >= self.timeout:
+                return False
+            return bool(self._result)
+
+    def _run(self):
+        try:
+            result = self.check()
+        except Exception:
+            result = False
+        with self._lock:
+            self._result = result
+            self._checked_at = time.monotonic()
+            self._running_since = None
+            self._done.set()
+
+
+def database_check(engine, logger, timeout):
+    """Return a check that runs 'SELECT 1' on its own connection, bounded by a server-side statement timeout."""
+    sql = f'SET LOCAL statement_timeout = {int(timeout * 1000)}'
+
+    def _check():
+        try:
+            with engine.begin() as connection:
+                connection.execute(text(sql))
+                connection.execute(text('SELECT 1'))
+            return True
+        except Exception:
+            logger.exception('Database connection error')
+            return False
+    return _check
+
+
+def database_health(app):
+    health = app.extensions.get('squiggy_database_health')
+    if health is None:
+        timeout = app.config['HEALTH_CHECK_TIMEOUT']
+        check = database_check(db.engine, app.logger, timeout)
+        health = app.extensions['squiggy_database_health'] = CachedHealthCheck(check, app.config['HEALTH_CHECK_TTL'], timeout)
+    return health
@@ -23,10 +23,48 @@ SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
 ENHANCEMENTS, OR MODIFICATIONS.
 """
 
+from functools import wraps
+import gzip
 import urllib
 
-from flask import Response
-import simplejson as json
+from flask import current_app as app, has_app_context, make_response, request, Response, stream_with_context
+from squiggy.lib.json_backends import get_dumps
+from werkzeug.http import generate_etag
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Encoded rows are buffered up to this many bytes before a chunk is handed to the WSGI server.
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class PrecompressedDocument:
+    """A document held in memory alongside its gzip and (if the brotli package is installed) brotli encodings.
+
+    Encodings are built once, when the document is loaded. Each representation has its own strong ETag.
+    """
+
+    def __init__(self, data, mimetype):
+        self.mimetype = mimetype
+        etag = generate_etag(data)
+        self.representations = {'identity': (data, etag)}
+        if brotli:
+            self.representations['br'] = (brotli.compress(data, quality=11), f'{etag}-br')
+        self.representations['gzip'] = (gzip.compress(data, compresslevel=9, mtime=0), f'{etag}-gz')
+
+    def to_response(self):
+        """Negotiate an encoding with the current request's Accept-Encoding and answer a matching If-None-Match with 304."""
+        encoding = request.accept_encodings.best_match(list(self.representations), default='identity')
+        data, etag = self.representations[encoding]
+        response = Response(b'' if request.if_none_match.contains_weak(etag) else data, mimetype=self.mimetype)
+        if encoding != 'identity':
+            response.content_encoding = encoding
+        response.vary.add('Accept-Encoding')
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
 
 
 def add_param_to_url(url, param):
@@ -36,6 +74,106 @@ def add_param_to_url(url, param):
     return urllib.parse.urlunparse(parsed_url._replace(query=urllib.parse.urlencode(parsed_query)))
 
 
+def json_dumps(obj, **kwargs):
+    """Serialize with the configured JSON_ENCODER_BACKEND, NaN-tolerant and compact; returns str or bytes."""
+    return _configured_dumps()(obj, **kwargs)
+
+
 def tolerant_jsonify(obj, status=200, **kwargs):
-    content = json.dumps(obj, ignore_nan=True, separators=(',', ':'), **kwargs)
+    content = json_dumps(obj, **kwargs)
     return Response(content, mimetype='application/json', status=status)
+
+
+def conditional_response(max_age=0, private=False, static=False):
+    """Decorate a GET view with a strong ETag and Cache-Control, answering a matching If-None-Match with 304.
+
+    Dynamic views run on every request and their body is hashed. A 'static' view's payload must not change for the
+    life of the app: it is rendered once (see precompute_static_responses) and its ETag is checked before the view
+    would run. With max_age=0, clients are told to revalidate on every use.
+    """
+    def decorator(view):
+        key = f'{view.__module__}.{view.__qualname__}'
+        if static:
+            _static_views[key] = view
+
+        @wraps(view)
+        def _conditional_view(*args, **kwargs):
+            if static and not (args or kwargs):
+                response = _static_response(key, view)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                response.add_etag()
+            if private:
+                response.cache_control.private = True
+            else:
+                response.cache_control.public = True
+            if max_age:
+                response.cache_control.max_age = max_age
+            else:
+                response.cache_control.no_cache = True
+            return response.make_conditional(request)
+        return _conditional_view
+    return decorator
+
+
+def precompute_static_responses(app):
+    """Render every view decorated with conditional_response(static=True) once, at startup."""
+    with app.test_request_context():
+        for key, view in _static_views.items():
+            _static_response(key, view)
+
+
+def tolerant_jsonify_stream(iterable, status=200, chunk_size=STREAM_CHUNK_SIZE, **kwargs):
+    """Stream a JSON array, encoding one element at a time.
+
+    Accepts any iterable (including generators and SQLAlchemy 'yield_per' queries) whose elements are serializable
+    by tolerant_jsonify. The full document is never held in memory; only the current chunk is.
+    """
+    dumps = _configured_dumps()
+
+    def _generate():
+        buffer = [b'[']
+        buffered = 1
+        for index, item in enumerate(iterable):
+            encoded = dumps(item, **kwargs)
+            if isinstance(encoded, str):
+                encoded = encoded.encode('utf-8')
+            if index:
+                buffer.append(b',')
+                buffered += 1
+            buffer.append(encoded)
+            buffered += len(encoded)
+            if buffered >= chunk_size:
+                yield b''.join(buffer)
+                buffer = []
+                buffered = 0
+        buffer.append(b']')
+        yield b''.join(buffer)
+
+    return Response(stream_with_context(_generate()), mimetype='application/json', status=status)
+
+
+def _configured_dumps():
+    backend = app.config.get('JSON_ENCODER_BACKEND', 'simplejson') if has_app_context() else 'simplejson'
+    return get_dumps(backend)
+
+
+# Views registered with conditional_response(static=True); the rendered responses are kept per app.
+_static_views = {}
+
+
+def _static_response(key, view):
+    rendered = app.extensions.setdefault('squiggy_static_responses', {})
+    if key not in rendered:
+        response = make_response(view())
+        data = response.get_data()
+        rendered[key] = (data, response.status_code, response.mimetype, generate_etag(data))
+    data, status, mimetype, etag = rendered[key]
+    if request.if_none_match.contains_weak(etag):
+        # Let make_conditional turn this into a 304 without copying the body.
+        data = b''
+    response = Response(data, mimetype=mimetype, status=status)
+    response.set_etag(etag)
+    return response
@@ -0,0 +1,116 @@
+"""
+Copyright ©2021. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from decimal import Decimal
+from enum import Enum
+import logging
+from uuid import UUID
+
+import simplejson
+
+"""JSON encoder backends for API responses.
+
+Every backend honors the encoding rules of the original simplejson-based tolerant_jsonify: NaN and Infinity become
+null, Decimal is written as a number, and datetimes and dataclasses (like any other type simplejson cannot handle
+natively) go to the caller's 'default' hook or raise TypeError. The exceptions are UUID and Enum: orjson always writes
+them natively, with no option to pass them through, so the simplejson backend writes them the same way, a UUID as its
+canonical string and an Enum member as its value. Output of the 'orjson' backend differs only in insignificant ways:
+raw UTF-8 rather than \\u escapes, and '1e100' rather than '1e+100'.
+"""
+
+logger = logging.getLogger(__name__)
+
+
+def simplejson_dumps(obj, default=None, **kwargs):
+    return simplejson.dumps(obj, default=_orjson_native_default(default), ignore_nan=True, separators=(',', ':'), **kwargs)
+
+
+def _orjson_native_default(default):
+    def _default(obj):
+        if isinstance(obj, UUID):
+            return str(obj)
+        if isinstance(obj, Enum):
+            return obj.value
+        if default is None:
+            raise TypeError(f'Object of type {obj.__class__.__name__} is not JSON serializable')
+        return default(obj)
+    return _default
+
+
+def _orjson_dumps_factory():
+    import orjson
+
+    # Anything orjson would serialize differently than simplejson is passed through to our 'default' hook, which
+    # hands the whole payload back to simplejson.
+    options = orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_SUBCLASS
+
+    class _Unsupported(Exception):
+        pass
+
+    def _wrap_default(default):
+        def _default(obj):
+            if default is None or isinstance(obj, Decimal):
+                raise _Unsupported()
+            return default(obj)
+        return _default
+
+    def orjson_dumps(obj, **kwargs):
+        default = kwargs.pop('default', None)
+        if not kwargs:
+            try:
+                return orjson.dumps(obj, default=_wrap_default(default), option=options)
+            except (_Unsupported, TypeError):
+                # orjson.JSONEncodeError is a TypeError: non-string keys, integers beyond 64 bits and the like.
+                pass
+        if default is not None:
+            kwargs['default'] = default
+        return simplejson_dumps(obj, **kwargs)
+
+    return orjson_dumps
+
+
+_factories = {
+    'orjson': _orjson_dumps_factory,
+    'simplejson': lambda: simplejson_dumps,
+}
+_resolved = {}
+
+
+def get_dumps(backend):
+    """Return the 'dumps' function of the named backend, falling back to simplejson if it is unavailable."""
+    dumps = _resolved.get(backend)
+    if dumps is None:
+        factory = _factories.get(backend)
+        if factory is None:
+            logger.warning(f'Unknown JSON encoder backend \'{backend}\'; falling back to simplejson.')
+            dumps = simplejson_dumps
+        else:
+            try:
+                dumps = factory()
+            except ImportError:
+                logger.warning(f'JSON encoder backend \'{backend}\' is not installed; falling back to simplejson.')
+                dumps = simplejson_dumps
+        _resolved[backend] = dumps
+    return dumps
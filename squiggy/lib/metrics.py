@@ -0,0 +1,353 @@
+"""
+Copyright ©2021. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from bisect import bisect_left
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import weakref
+
+from flask import g, request
+
+"""Request metrics, rendered in the Prometheus text exposition format.
+
+Request threads never contend for a lock: each thread updates its own shard of counters, and shards are summed only
+when metrics are scraped. When a thread exits, its shard is folded into a single aggregate of retired shards, so
+thread-per-request servers do not accumulate shards.
+
+Under the prefork server, each worker process writes its samples to a directory shared with the other workers, every
+METRICS_FLUSH_INTERVAL seconds and when it exits, and a scrape (served by any one worker) adds up the samples of all of
+them. Once a worker has exited, the master folds its counters and histograms into an archive of exited workers, so
+totals never go backwards when workers are recycled.
+"""
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Shard:
+
+    def __init__(self, counters=None, gauges=None, histograms=None):
+        self.counters = counters or {}
+        self.gauges = gauges or {}
+        # (route, method) -> [per-bucket counts, including +Inf], sum, count
+        self.histograms = histograms or {}
+
+
+class _Owner:
+    """Referenced only from its thread's local storage, and so collected as soon as the thread exits."""
+
+    __slots__ = ('__weakref__',)
+
+
+_shards = []
+_retired = _Shard()
+_shards_lock = threading.Lock()
+_local = threading.local()
+
+# Functions returning (gauges, counters), each as {name: value}, for process-wide metrics kept outside this module.
+_collectors = []
+
+# Set in prefork processes: the directory through which workers share samples and, in a worker, the worker's id.
+_multiprocess_dir = None
+_worker_id = None
+_worker_file_lock = threading.Lock()
+_WORKER_FILE = re.compile(r'worker-(\d+)\.json')
+
+
+def _shard():
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        shard = _Shard()
+        with _shards_lock:
+            _shards.append(shard)
+        _local.owner = _Owner()
+        weakref.finalize(_local.owner, _retire, shard)
+        _local.shard = shard
+    return shard
+
+
+def _retire(shard):
+    with _shards_lock:
+        # A forked worker drops the shards it inherited (see start_worker) before their threads' locals are collected.
+        if shard in _shards:
+            _shards.remove(shard)
+            _merge(_retired.counters, _retired.gauges, _retired.histograms, shard)
+
+
+def increment(name, labels=(), value=1):
+    counters = _shard().counters
+    key = (name, labels)
+    counters[key] = counters.get(key, 0) + value
+
+
+def add_to_gauge(name, labels=(), value=1):
+    gauges = _shard().gauges
+    key = (name, labels)
+    gauges[key] = gauges.get(key, 0) + value
+
+
+def observe_latency(labels, seconds):
+    histograms = _shard().histograms
+    histogram = histograms.get(labels)
+    if histogram is None:
+        histogram = histograms[labels] = [[0] * (len(LATENCY_BUCKETS) + 1), 0.0, 0]
+    histogram[0][bisect_left(LATENCY_BUCKETS, seconds)] += 1
+    histogram[1] += seconds
+    histogram[2] += 1
+
+
+def start_request():
+    g.metrics_started_at = time.perf_counter()
+    g.metrics_in_flight = True
+    add_to_gauge('squiggy_http_requests_in_flight')
+
+
+def end_request(response):
+    started_at = g.pop('metrics_started_at', None)
+    if started_at is None:
+        return
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    increment('squiggy_http_requests_total', (('route', route), ('method', request.method), ('status', str(response.status_code))))
+    observe_latency((('route', route), ('method', request.method)), time.perf_counter() - started_at)
+
+
+def finish_request():
+    # Runs on teardown, so the in-flight gauge is decremented even if an after-request hook failed.
+    if g.pop('metrics_in_flight', False):
+        add_to_gauge('squiggy_http_requests_in_flight', value=-1)
+
+
+def count_error(handler):
+    increment('squiggy_http_errors_total', (('handler', handler),))
+
+
+def snapshot():
+    """Merge every thread's shard into one set of counters, gauges and histograms."""
+    counters, gauges, histograms = {}, {}, {}
+    # Holding the lock keeps a shard from being counted both live and retired; only thread start and exit wait on it.
+    with _shards_lock:
+        for shard in [_retired] + _shards:
+            _merge(counters, gauges, histograms, shard)
+    return counters, gauges, histograms
+
+
+def _merge(counters, gauges, histograms, shard):
+    # dict.copy() of string-keyed dicts is atomic under the GIL, so owners need not stop writing.
+    for key, value in shard.counters.copy().items():
+        counters[key] = counters.get(key, 0) + value
+    for key, value in shard.gauges.copy().items():
+        gauges[key] = gauges.get(key, 0) + value
+    for key, (buckets, total, count) in shard.histograms.copy().items():
+        merged = histograms.setdefault(key, [[0] * len(buckets), 0.0, 0])
+        merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+        merged[1] += total
+        merged[2] += count
+
+
+def register_collector(collector):
+    """Sample 'collector', a function returning (gauges, counters) as {name: value}, with every scrape."""
+    if collector not in _collectors:
+        _collectors.append(collector)
+
+
+def collect():
+    """Merge the samples of every thread and collector and, in a prefork worker, those of every other worker."""
+    if _worker_id is not None:
+        counters, gauges, histograms = flush_worker()
+        _merge_workers(counters, gauges, histograms)
+        return counters, gauges, histograms
+    return _collect_process()
+
+
+def render():
+    """Render all metrics in Prometheus text format."""
+    counters, gauges, histograms = collect()
+    lines = []
+    _render_samples(lines, counters, 'counter')
+    _render_samples(lines, gauges, 'gauge')
+    name = 'squiggy_http_request_duration_seconds'
+    if histograms:
+        lines.append(f'# TYPE {name} histogram')
+    for labels, (buckets, total, count) in sorted(histograms.items()):
+        cumulative = 0
+        for bound, bucket_count in zip(LATENCY_BUCKETS + ('+Inf',), buckets):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{_format_labels(labels + (("le", str(bound)),))} {cumulative}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {total}')
+        lines.append(f'{name}_count{_format_labels(labels)} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def share_across_workers(directory):
+    """In the prefork master, before forking: have workers share their samples through files in 'directory'."""
+    global _multiprocess_dir
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+    _multiprocess_dir = directory
+
+
+def stop_sharing():
+    global _multiprocess_dir
+    if _multiprocess_dir:
+        shutil.rmtree(_multiprocess_dir, ignore_errors=True)
+        _multiprocess_dir = None
+
+
+def start_worker(app, worker_id):
+    """In a newly forked worker: drop the samples inherited from the master and start sharing this worker's own."""
+    global _retired, _shards_lock, _worker_id
+    if not _multiprocess_dir:
+        return
+    # Another thread of the master may have held the lock when it forked.
+    _shards_lock = threading.Lock()
+    _local.__dict__.clear()
+    with _shards_lock:
+        _shards.clear()
+        _retired = _Shard()
+    _worker_id = worker_id
+
+    def _flush_periodically():
+        while True:
+            time.sleep(app.config['METRICS_FLUSH_INTERVAL'])
+            with app.app_context():
+                flush_worker()
+
+    threading.Thread(target=_flush_periodically, name='squiggy-metrics-flush', daemon=True).start()
+
+
+def flush_worker():
+    """In a prefork worker: write this worker's samples for others to read, and return them. Needs an app context."""
+    with _worker_file_lock:
+        samples = _collect_process()
+        if _worker_id is not None:
+            _write_samples(_worker_path(_worker_id), *samples)
+    return samples
+
+
+def retire_worker(worker_id):
+    """In the prefork master, once a worker has exited: move its counters and histograms to the archive.
+
+    Its gauges, such as requests in flight, no longer describe anything and are dropped.
+    """
+    archive_path = os.path.join(_multiprocess_dir, 'archive.json')
+    archive = _read_samples(archive_path) or ({}, {}, {}, [])
+    counters, _, histograms, retired_ids = archive
+    samples = _read_samples(_worker_path(worker_id))
+    if samples:
+        _merge(counters, {}, histograms, _Shard(counters=samples[0], histograms=samples[2]))
+    retired_ids.append(worker_id)
+    # Readers skip the files of archived workers, so the archive is written before the worker's file is removed.
+    _write_samples(archive_path, counters, {}, histograms, retired_ids)
+    try:
+        os.remove(_worker_path(worker_id))
+    except FileNotFoundError:
+        pass
+
+
+def _collect_process():
+    counters, gauges, histograms = snapshot()
+    for collector in _collectors:
+        extra_gauges, extra_counters = collector()
+        for name, value in extra_counters.items():
+            counters[(name, ())] = value
+        for name, value in extra_gauges.items():
+            gauges[(name, ())] = value
+    return counters, gauges, histograms
+
+
+def _merge_workers(counters, gauges, histograms):
+    others = {}
+    for entry in os.scandir(_multiprocess_dir):
+        match = _WORKER_FILE.fullmatch(entry.name)
+        if match and int(match.group(1)) != _worker_id:
+            samples = _read_samples(entry.path)
+            if samples:
+                others[int(match.group(1))] = samples
+    # Read after the workers' files: a worker retired meanwhile is then in the archive, and is not counted twice.
+    archive = _read_samples(os.path.join(_multiprocess_dir, 'archive.json'))
+    if archive:
+        _merge(counters, gauges, histograms, _Shard(*archive[:3]))
+        for worker_id in archive[3]:
+            others.pop(worker_id, None)
+    for samples in others.values():
+        _merge(counters, gauges, histograms, _Shard(*samples[:3]))
+
+
+def _worker_path(worker_id):
+    return os.path.join(_multiprocess_dir, f'worker-{worker_id}.json')
+
+
+def _write_samples(path, counters, gauges, histograms, retired_ids=()):
+    document = {
+        'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+        'gauges': [[name, labels, value] for (name, labels), value in gauges.items()],
+        'histograms': [[labels, buckets, total, count] for labels, (buckets, total, count) in histograms.items()],
+        'retiredWorkers': list(retired_ids),
+    }
+    # Readers see the old file or the new one, never part of one.
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(document, f)
+    os.replace(temp_path, path)
+
+
+def _read_samples(path):
+    try:
+        with open(path) as f:
+            document = json.load(f)
+    except FileNotFoundError:
+        return None
+
+    def _labels(labels):
+        return tuple(tuple(pair) for pair in labels)
+    return (
+        {(name, _labels(labels)): value for name, labels, value in document['counters']},
+        {(name, _labels(labels)): value for name, labels, value in document['gauges']},
+        {_labels(labels): [buckets, total, count] for labels, buckets, total, count in document['histograms']},
+        document['retiredWorkers'],
+    )
+
+
+def _render_samples(lines, samples, metric_type):
+    declared = set()
+    for (name, labels), value in sorted(samples.items()):
+        if name not in declared:
+            lines.append(f'# TYPE {name} {metric_type}')
+            declared.add(name)
+        lines.append(f'{name}{_format_labels(labels)} {value}')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (f'{key}="{_escape(value)}"' for key, value in labels)
+    return '{' + ','.join(escaped) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
@@ -0,0 +1,178 @@
+"""
+Copyright ©2021. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from collections import namedtuple
+from copy import copy
+import hashlib
+import os
+import re
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import NullPool
+
+# Arbitrary key of the Postgres advisory lock held while migrating or building a template database.
+LOCK_KEY = 6271966
+
+Migration = namedtuple('Migration', 'version name sql checksum')
+
+_MIGRATION_FILENAME = re.compile(r'^(\d+)_(\w+)\.sql$')
+
+
+class MigrationError(Exception):
+    pass
+
+
+def load_migrations(directory):
+    """Read migrations, in version order, from files named like '0001_create_authorized_users.sql'."""
+    migrations = []
+    for filename in os.listdir(directory):
+        match = _MIGRATION_FILENAME.match(filename)
+        if match:
+            with open(os.path.join(directory, filename), 'r') as sql_file:
+                sql = sql_file.read()
+            checksum = hashlib.sha256(sql.encode('utf-8')).hexdigest()
+            migrations.append(Migration(int(match.group(1)), match.group(2), sql, checksum))
+    migrations.sort(key=lambda m: m.version)
+    versions = [m.version for m in migrations]
+    if len(set(versions)) != len(versions):
+        raise MigrationError(f'Duplicate migration versions in {directory}')
+    return migrations
+
+
+def applied_migrations(engine):
+    """Map version to checksum of each migration recorded in the schema_migrations table."""
+    with engine.connect() as connection:
+        exists = connection.execute(text("SELECT to_regclass('schema_migrations')")).scalar()
+        if not exists:
+            return {}
+        return dict(connection.execute(text('SELECT version, checksum FROM schema_migrations')).fetchall())
+
+
+def migrate(engine, migrations):
+    """Apply, in order, each migration not yet recorded in schema_migrations; return those applied.
+
+    Every migration runs in its own transaction, together with the row recording it, under an advisory lock and with no
+    statement timeout: running 'migrate' again, or from several processes at once, applies nothing twice. A recorded
+    migration whose file has since changed raises MigrationError rather than leaving the schema silently out of step
+    with its source.
+    """
+    applied = []
+    for migration in migrations:
+        with engine.begin() as connection:
+            # Index builds and backfills may well outlast the app's statement timeout (DB_STATEMENT_TIMEOUT_MS).
+            connection.execute(text('SET LOCAL statement_timeout = 0'))
+            connection.execute(text('SELECT pg_advisory_xact_lock(:key)'), key=LOCK_KEY)
+            connection.execute(
+                text("""CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version integer PRIMARY KEY,
+                    name character varying(255) NOT NULL,
+                    checksum character varying(64) NOT NULL,
+                    applied_at timestamp with time zone DEFAULT now() NOT NULL
+                )"""),
+            )
+            checksum = connection.execute(
+                text('SELECT checksum FROM schema_migrations WHERE version = :version'),
+                version=migration.version,
+            ).scalar()
+            if checksum:
+                if checksum != migration.checksum:
+                    raise MigrationError(f'Migration {migration.version}_{migration.name} has changed since it was applied')
+                continue
+            connection.execute(text(migration.sql))
+            connection.execute(
+                text('INSERT INTO schema_migrations (version, name, checksum) VALUES (:version, :name, :checksum)'),
+                version=migration.version,
+                name=migration.name,
+                checksum=migration.checksum,
+            )
+            applied.append(migration)
+    return applied
+
+
+def fingerprint(migrations, *extra):
+    """Identify a database built from these migrations (and any 'extra' inputs, such as seed data)."""
+    digest = hashlib.sha256()
+    for value in [m.checksum for m in migrations] + [repr(e) for e in extra]:
+        digest.update(value.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def clone_from_template(database_uri, build, build_fingerprint, template_name=None):
+    """Replace the database at 'database_uri' with a copy of a template database, building the template if needed.
+
+    The template (by default, the target's name plus '_template') is built by 'build', called with the template's URI,
+    only when it is missing or its recorded fingerprint differs from 'build_fingerprint'. Cloning with CREATE DATABASE
+    ... TEMPLATE is a file-level copy, so setup time no longer grows with the schema. Nothing may be connected to the
+    target database (dispose of engines first), and the database user needs the CREATEDB privilege.
+    """
+    target_url = make_url(database_uri)
+    template_url = copy(target_url)
+    template_url.database = template_name or f'{target_url.database}_template'
+    marker = f'squiggy:{build_fingerprint}'
+
+    engine = _maintenance_engine(target_url)
+    try:
+        with engine.connect() as connection:
+            connection.execute(text('SELECT pg_advisory_lock(:key)'), key=LOCK_KEY)
+            try:
+                current_marker = connection.execute(
+                    text("SELECT shobj_description(oid, 'pg_database') FROM pg_database WHERE datname = :name"),
+                    name=template_url.database,
+                ).scalar()
+                if current_marker != marker:
+                    connection.execute(text(f'DROP DATABASE IF EXISTS {_quote(template_url.database)}'))
+                    connection.execute(text(f'CREATE DATABASE {_quote(template_url.database)}'))
+                    build(str(template_url))
+                    connection.execute(text(f"COMMENT ON DATABASE {_quote(template_url.database)} IS '{marker}'"))
+                connection.execute(text(f'DROP DATABASE IF EXISTS {_quote(target_url.database)}'))
+                connection.execute(
+                    text(f'CREATE DATABASE {_quote(target_url.database)} TEMPLATE {_quote(template_url.database)}'),
+                )
+            finally:
+                connection.execute(text('SELECT pg_advisory_unlock(:key)'), key=LOCK_KEY)
+    finally:
+        engine.dispose()
+
+
+def drop_database(database_uri):
+    """Drop the database at 'database_uri', if it exists. Nothing may be connected to it."""
+    target_url = make_url(database_uri)
+    engine = _maintenance_engine(target_url)
+    try:
+        with engine.connect() as connection:
+            connection.execute(text(f'DROP DATABASE IF EXISTS {_quote(target_url.database)}'))
+    finally:
+        engine.dispose()
+
+
+def _maintenance_engine(url):
+    maintenance_url = copy(url)
+    maintenance_url.database = 'postgres'
+    return create_engine(maintenance_url, poolclass=NullPool, isolation_level='AUTOCOMMIT')
+
+
+def _quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
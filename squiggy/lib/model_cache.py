@@ -0,0 +1,121 @@
+"""
+Copyright ©2021. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import make_transient_to_detached, Session
+from squiggy import db
+from squiggy.lib.cache import TTLCache
+
+MISSING = object()
+
+
+class ModelCache:
+    """Read-through cache of model rows, looked up by any of a model's unique columns.
+
+    Column values, not ORM instances, are cached: a hit is merged into the current DB session without a query. Lookups
+    that find nothing are cached too, for the (typically shorter) 'negative_ttl'. Inserts, updates and deletes through
+    the ORM invalidate affected entries, both at flush and again after commit, provided the model's mapper events call
+    'after_write'; any other write (e.g., bulk SQL) must call 'invalidate', with its session, or 'clear' itself.
+    """
+
+    def __init__(self, model, keys, maxsize, ttl, negative_ttl):
+        self.model = model
+        self.keys = keys
+        self.columns = [column.key for column in inspect(model).column_attrs]
+        self.found = TTLCache(maxsize, ttl)
+        self.not_found = TTLCache(maxsize, negative_ttl)
+
+    def fetch(self, key, value, loader):
+        """Return a session-bound instance or None, calling 'loader' (which runs the real query) only on a cache miss."""
+        values = self.get_values(key, value)
+        if values is MISSING:
+            instance = loader()
+            if instance is None:
+                self.not_found.set((key, value), True)
+            else:
+                self.put(instance)
+            return instance
+        return values and self.to_instance(values)
+
+    def get_values(self, key, value):
+        values = self.found.get((key, value), MISSING)
+        if values is MISSING and self.not_found.get((key, value)):
+            return None
+        return values
+
+    def put(self, instance):
+        values = {column: getattr(instance, column) for column in self.columns}
+        for key in self.keys:
+            self.found.set((key, values[key]), values)
+            self.not_found.delete((key, values[key]))
+
+    def to_instance(self, values):
+        instance = self.model.__mapper__.class_manager.new_instance()
+        for column, value in values.items():
+            setattr(instance, column, value)
+        make_transient_to_detached(instance)
+        return db.session.merge(instance, load=False)
+
+    def invalidate(self, key, value, session=None):
+        """Drop cached entries for a row; given a 'session', do it again when the session's transaction ends."""
+        if session is not None:
+            session.info.setdefault('squiggy_cache_invalidations', []).append((self, key, value))
+        values = self.found.get((key, value))
+        self.found.delete((key, value))
+        self.not_found.delete((key, value))
+        if values:
+            for other_key in self.keys:
+                self.found.delete((other_key, values[other_key]))
+
+    def clear(self):
+        self.found.clear()
+        self.not_found.clear()
+
+    def stats(self):
+        found = self.found.stats()
+        not_found = self.not_found.stats()
+        return {
+            'size': found['size'] + not_found['size'],
+            'hits': found['hits'] + not_found['hits'],
+            'misses': not_found['misses'],
+        }
+
+    def after_write(self, target):
+        session = inspect(target).session
+        keys = [(key, getattr(target, key)) for key in self.keys]
+        # Also invalidate by values as they were before this flush (e.g., a changed uid).
+        for key in self.keys:
+            history = inspect(target).attrs[key].history
+            keys.extend((key, value) for value in history.deleted or ())
+        for key, value in keys:
+            self.invalidate(key, value, session)
+
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_soft_rollback')
+def _after_transaction(session, *args):
+    # A concurrent reader may have re-cached a row between our flush and commit (or rollback).
+    for cache, key, value in session.info.pop('squiggy_cache_invalidations', []):
+        cache.invalidate(key, value)
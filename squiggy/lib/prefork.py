@@ -0,0 +1,280 @@
+"""
+Copyright ©2021. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import gc
+import os
+import random
+import signal
+import socket
+import threading
+import time
+
+from squiggy import db
+from squiggy.lib import metrics
+from squiggy.lib.async_server import AsyncWSGIServer
+from squiggy.lib.startup import join_background_tasks
+from squiggy.logger import restart_log_listeners, stop_log_listeners
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+"""A pre-forking, multi-threaded WSGI server for production.
+
+The master process holds an app that is already created (configs loaded, routes registered, static payloads rendered)
+and a listening socket, then forks workers that inherit both, sharing the app's memory copy-on-write. Each worker serves
+requests from a fixed pool of threads or, with the 'asyncio' worker class, from an event loop backed by such a pool
+(see async_server.py). A worker exits after serving about SERVER_MAX_REQUESTS requests (plus random jitter, so that
+workers do not all recycle at once) and the master forks a replacement. On SIGTERM or SIGINT, workers
+stop accepting connections and finish in-flight requests, for up to SERVER_GRACEFUL_TIMEOUT seconds.
+
+Each worker keeps its own caches and connection pool. Metrics are shared across workers (see metrics.py).
+"""
+
+# A worker that exits sooner than this after being forked is probably failing at startup; respawns are then delayed.
+MIN_WORKER_LIFETIME = 1
+
+
+class RequestHandler(WSGIRequestHandler):
+
+    def log_request(self, *args, **kwargs):
+        # Requests are logged by the app (see squiggy/lib/request_metrics.py), not line by line here.
+        pass
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """A Werkzeug WSGI server handling each connection on a fixed-size thread pool."""
+
+    multithread = True
+
+    def __init__(self, host, app, fd, threads, max_requests=0):
+        super().__init__(host, 0, app, handler=RequestHandler, fd=fd)
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='squiggy-request')
+        # Connections are not accepted while every thread is busy; they wait in the listen backlog for any worker.
+        self.idle_threads = threading.BoundedSemaphore(threads)
+        self.max_requests = max_requests
+        self.requests = 0
+        self._requests_lock = threading.Lock()
+        self._stopping = False
+
+    def process_request(self, request, client_address):
+        self.idle_threads.acquire()
+        self.executor.submit(self._process_request, request, client_address)
+        if self.max_requests:
+            with self._requests_lock:
+                self.requests += 1
+                if self.requests == self.max_requests:
+                    self.stop()
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.idle_threads.release()
+
+    def stop(self):
+        # serve_forever returns once this thread has told it to. Called from a signal handler or a request thread, so
+        # it must not wait here.
+        if not self._stopping:
+            self._stopping = True
+            threading.Thread(target=self.shutdown, daemon=True).start()
+
+    def serve(self):
+        try:
+            self.serve_forever()
+        finally:
+            # Let in-flight requests finish.
+            self.executor.shutdown(wait=True)
+            self.server_close()
+
+
+class PreforkServer:
+
+    def __init__(self, app, host, port, workers, threads, max_requests, max_requests_jitter, graceful_timeout, backlog, worker_class='threads'):
+        if worker_class not in WORKER_CLASSES:
+            raise ValueError(f'Unknown worker class \'{worker_class}\'; expected one of {sorted(WORKER_CLASSES)}')
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        self.threads = threads
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+        self.backlog = backlog
+        self.worker_class = worker_class
+        self.children = {}
+        self.socket = None
+        self.spawned = 0
+        self.worker_ids = {}
+        self._stopping = False
+
+    @classmethod
+    def from_config(cls, app, **overrides):
+        options = {
+            'host': app.config['HOST'],
+            'port': app.config['PORT'],
+            'workers': app.config['SERVER_WORKERS'],
+            'threads': app.config['THREADS_PER_PAGE'],
+            'max_requests': app.config['SERVER_MAX_REQUESTS'],
+            'max_requests_jitter': app.config['SERVER_MAX_REQUESTS_JITTER'],
+            'graceful_timeout': app.config['SERVER_GRACEFUL_TIMEOUT'],
+            'backlog': app.config['SERVER_BACKLOG'],
+            'worker_class': app.config['SERVER_WORKER_CLASS'],
+        }
+        options.update({key: value for key, value in overrides.items() if value is not None})
+        return cls(app, **options)
+
+    def run(self):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((self.host, self.port))
+        self.socket.listen(self.backlog)
+        self.socket.set_inheritable(True)
+        self.app.logger.info(
+            f'Master {os.getpid()} listening on {self.host}:{self.socket.getsockname()[1]} with {self.workers} {self.worker_class} '
+            f'workers of {self.threads} threads',
+        )
+        # A fork copies no threads: a warm-up thread still running could leave a worker with a lock held forever, or add
+        # connections to the pool after it is disposed below.
+        join_background_tasks(self.app)
+        # Forked workers must not share the master's database connections.
+        with self.app.app_context():
+            db.engine.dispose()
+        metrics.share_across_workers(os.path.join(self.app.config['METRICS_MULTIPROCESS_DIR'], str(os.getpid())))
+        # Objects that exist now are never collected, so the collector does not touch (and copy) their pages in workers.
+        gc.freeze()
+
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        try:
+            for _ in range(self.workers):
+                self._spawn()
+            self._monitor()
+        finally:
+            self._stop_workers()
+            self.socket.close()
+            metrics.stop_sharing()
+
+    def _spawn(self):
+        self.spawned += 1
+        worker_id = self.spawned
+        pid = os.fork()
+        if pid:
+            self.children[pid] = time.monotonic()
+            self.worker_ids[pid] = worker_id
+            return
+        exit_code = 0
+        try:
+            self._run_worker(worker_id)
+        except BaseException:
+            self.app.logger.exception(f'Worker {os.getpid()} failed')
+            exit_code = 1
+        finally:
+            _flush_metrics(self.app)
+            stop_log_listeners(self.app)
+            os._exit(exit_code)
+
+    def _monitor(self):
+        while not self._stopping:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                # Waiting with a timeout lets a stop signal be noticed promptly.
+                time.sleep(0.2)
+                continue
+            started_at = self.children.pop(pid, None)
+            if pid in self.worker_ids:
+                metrics.retire_worker(self.worker_ids.pop(pid))
+            if self._stopping or started_at is None:
+                continue
+            self.app.logger.info(f'Worker {pid} exited with status {status}; forking a replacement')
+            if time.monotonic() - started_at < MIN_WORKER_LIFETIME:
+                time.sleep(MIN_WORKER_LIFETIME)
+            self._spawn()
+
+    def _handle_stop(self, signum, frame):
+        self._stopping = True
+
+    def _stop_workers(self):
+        for pid in self.children:
+            _kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout
+        while self.children and time.monotonic() < deadline:
+            for pid in list(self.children):
+                if os.waitpid(pid, os.WNOHANG)[0]:
+                    self.children.pop(pid)
+            time.sleep(0.1)
+        for pid in self.children:
+            self.app.logger.warning(f'Worker {pid} did not stop within {self.graceful_timeout} seconds; killing it')
+            _kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        self.children = {}
+
+    def _run_worker(self, worker_id):
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        after_fork(self.app)
+        metrics.start_worker(self.app, worker_id)
+        max_requests = self.max_requests and self.max_requests + random.randint(0, self.max_requests_jitter)
+        server_class = WORKER_CLASSES[self.worker_class]
+        server = server_class(self.host, self.app, self.socket.fileno(), self.threads, max_requests=max_requests)
+        signal.signal(signal.SIGTERM, lambda signum, frame: server.stop())
+        self.app.logger.info(f'Worker {os.getpid()} started')
+        server.serve()
+        self.app.logger.info(f'Worker {os.getpid()} stopped after {server.requests} requests')
+
+
+WORKER_CLASSES = {
+    'asyncio': AsyncWSGIServer,
+    'threads': PooledWSGIServer,
+}
+
+
+def after_fork(app):
+    """Give a forked worker its own database connections, and the background threads that fork did not copy."""
+    with app.app_context():
+        db.engine.dispose()
+    restart_log_listeners(app)
+    # A health check's state (and its thread) belongs to the master; a new one is created on first use.
+    app.extensions.pop('squiggy_database_health', None)
+
+
+def _flush_metrics(app):
+    # A worker's last samples, left for the master to archive.
+    try:
+        with app.app_context():
+            metrics.flush_worker()
+    except Exception:
+        app.logger.exception(f'Worker {os.getpid()} failed to write its metrics')
+
+
+def _kill(pid, signum):
+    try:
+        os.kill(pid, signum)
+    except ProcessLookupError:
+        pass
@@ -0,0 +1,106 @@
+"""
+Copyright ©2021. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import cProfile
+from datetime import datetime
+import io
+import os
+import random
+import re
+import time
+
+from flask import g, request
+from flask_login import current_user
+
+"""On-demand profiling of individual requests.
+
+When PROFILING_ENABLED is set, a request is profiled if an admin asks for it (with an 'X-Squiggy-Profile' header or a
+'profile' query parameter) or if it is picked by PROFILING_SAMPLE_RATE. The profile is written in pstats format to
+PROFILING_DIR and its file name returned in the 'X-Squiggy-Profile' response header.
+"""
+
+PROFILE_HEADER = 'X-Squiggy-Profile'
+PROFILE_PARAM = 'profile'
+
+
+def start_profiling(app):
+    if not app.config['PROFILING_ENABLED'] or not _should_profile(app):
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler is active on this interpreter.
+        return
+    g.profiler = profiler
+    g.profiler_started_at = time.perf_counter()
+
+
+def stop_profiling(app, response=None):
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return response
+    profiler.disable()
+    if response is not None:
+        duration_ms = int((time.perf_counter() - g.pop('profiler_started_at')) * 1000)
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', request.path).strip('_') or 'root'
+        filename = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{request.method}-{slug}-{duration_ms}ms.prof"
+        directory = app.config['PROFILING_DIR']
+        os.makedirs(directory, exist_ok=True)
+        profiler.dump_stats(os.path.join(directory, filename))
+        response.headers[PROFILE_HEADER] = filename
+        app.logger.info(f'Request profile written to {filename}')
+    return response
+
+
+def list_profiles(directory):
+    """Return captured profiles, newest first."""
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for entry in os.scandir(directory):
+        if entry.name.endswith('.prof'):
+            stat = entry.stat()
+            profiles.append({
+                'name': entry.name,
+                'size': stat.st_size,
+                'createdAt': datetime.fromtimestamp(stat.st_mtime),
+            })
+    return sorted(profiles, key=lambda p: p['createdAt'], reverse=True)
+
+
+def summarize_profile(path, sort='cumulative', limit=30):
+    import pstats
+    stream = io.StringIO()
+    stats = pstats.Stats(path, stream=stream)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return stream.getvalue()
+
+
+def _should_profile(app):
+    if PROFILE_HEADER in request.headers or PROFILE_PARAM in request.args:
+        return current_user.is_authenticated and current_user.is_admin
+    sample_rate = app.config['PROFILING_SAMPLE_RATE']
+    return bool(sample_rate) and random.random() < sample_rate
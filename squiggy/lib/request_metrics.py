@@ -0,0 +1,183 @@
+"""
+Copyright ©2021. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from collections import Counter
+from datetime import datetime
+import logging
+import threading
+import time
+
+from flask import g, has_request_context, request, session
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from squiggy.lib.http import json_dumps
+
+"""Per-request timing, SQL statement instrumentation and the structured access log."""
+
+access_logger = logging.getLogger('squiggy.access')
+
+
+class QueryBudgetExceededError(Exception):
+    pass
+
+
+class QueryStats:
+    """Count and time of SQL statements, grouped by statement shape (the SQL text with its bind parameters unfilled)."""
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement, elapsed):
+        self.count += 1
+        self.time += elapsed
+        self.shapes[statement] += 1
+
+    def repeated_statements(self, threshold):
+        """Statement shapes run at least 'threshold' times: the signature of an N+1 query pattern."""
+        return {statement: count for statement, count in self.shapes.most_common() if count >= threshold}
+
+
+class QueryCounter(QueryStats):
+    """Count SQL statements run on this thread within a 'with' block, in or out of a request.
+
+    >>> with QueryCounter() as queries:
+    ...     AuthorizedUser.find_by_uid('2040')
+    >>> assert queries.count == 1
+    """
+
+    def __enter__(self):
+        _thread_counters().append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _thread_counters().remove(self)
+
+
+def start_request():
+    g.request_started_at = time.perf_counter()
+    g.query_stats = QueryStats()
+
+
+def check_query_budget(app):
+    """Log (or, if SQL_QUERY_BUDGET_RAISE, raise) if the current request exceeded its SQL budget or looks like N+1."""
+    stats = g.get('query_stats')
+    if stats is None:
+        return
+    budget = {
+        'count': app.config['SQL_QUERY_BUDGET_COUNT'],
+        'time_ms': app.config['SQL_QUERY_BUDGET_TIME_MS'],
+        **app.config['SQL_QUERY_BUDGETS'].get(request.endpoint, {}),
+    }
+    problems = []
+    if budget['count'] is not None and stats.count > budget['count']:
+        problems.append(f"{stats.count} SQL statements exceeds budget of {budget['count']}")
+    if budget['time_ms'] is not None and stats.time * 1000 > budget['time_ms']:
+        problems.append(f"{stats.time * 1000:.1f} ms of SQL exceeds budget of {budget['time_ms']} ms")
+    for statement, count in stats.repeated_statements(app.config['SQL_N_PLUS_ONE_THRESHOLD']).items():
+        app.logger.warning(f'Possible N+1 query pattern in {request.endpoint}: {count} executions of {statement}')
+    if problems:
+        message = f"{request.method} {request.path} ({request.endpoint}): {'; '.join(problems)}"
+        if app.config['SQL_QUERY_BUDGET_RAISE']:
+            raise QueryBudgetExceededError(message)
+        app.logger.warning(message)
+
+
+def log_access(app, response):
+    """Write one JSON record describing the current request; slow requests are promoted to WARNING."""
+    record = access_log_record(app, response)
+    if response.status_code >= 500:
+        level = logging.ERROR
+    elif response.status_code >= 400 or record['duration_ms'] >= app.config['ACCESS_LOG_SLOW_REQUEST_MS']:
+        level = logging.WARNING
+    else:
+        level = logging.DEBUG
+    if access_logger.isEnabledFor(level):
+        message = json_dumps(record)
+        access_logger.log(level, message if isinstance(message, str) else message.decode('utf-8'))
+    return record
+
+
+def access_log_record(app, response):
+    duration = time.perf_counter() - g.request_started_at if 'request_started_at' in g else 0.0
+    stats = g.get('query_stats') or QueryStats()
+    return {
+        'time': datetime.now().isoformat(),
+        'remote_addr': request.remote_addr,
+        'method': request.method,
+        'path': request.full_path,
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'duration_ms': round(duration * 1000, 3),
+        # Streamed responses have no length until they are sent.
+        'response_bytes': response.content_length,
+        # Flask-Login keeps the id in the session, so we need not load the user.
+        'user_id': session.get('_user_id'),
+        'db_queries': stats.count,
+        'db_time_ms': round(stats.time * 1000, 3),
+        'db_repeated_statements': len(stats.repeated_statements(app.config['SQL_N_PLUS_ONE_THRESHOLD'])),
+    }
+
+
+def instrument_db():
+    """Time every SQL statement, on any engine, and charge it to the current request and any active QueryCounter."""
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+
+
+_local = threading.local()
+
+
+def _thread_counters():
+    counters = getattr(_local, 'counters', None)
+    if counters is None:
+        counters = _local.counters = []
+    return counters
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('squiggy_query_started_at', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _record_query(conn, statement)
+
+
+def _handle_error(exception_context):
+    _record_query(exception_context.connection, exception_context.statement)
+
+
+def _record_query(conn, statement):
+    started = conn.info.get('squiggy_query_started_at') if conn is not None else None
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    if has_request_context() and 'query_stats' in g:
+        g.query_stats.record(statement, elapsed)
+    for counter in _thread_counters():
+        counter.record(statement, elapsed)
@@ -0,0 +1,62 @@
+"""
+Copyright ©2021. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import _app_ctx_stack, _request_ctx_stack
+
+"""Which request Flask's context locals belong to.
+
+Werkzeug keys the request and app context stacks, and Flask-SQLAlchemy keys its scoped session, by thread. A request
+served on an event loop (see squiggy/lib/async_server.py) moves between threads and the loop, so while a request
+scope is set, it, rather than the thread, is the key: request, g, current_user and db.session then resolve to that
+request wherever its code runs. With no scope set, as under WSGI servers, nothing changes.
+"""
+
+_scope = ContextVar('squiggy_request_scope', default=None)
+_thread_ident = _request_ctx_stack.__ident_func__
+
+
+def current_scope():
+    """Return the key of the current request's context locals: its scope if one is set, otherwise this thread."""
+    scope = _scope.get()
+    return _thread_ident() if scope is None else scope
+
+
+@contextmanager
+def request_scope(scope=None):
+    """Key context locals by 'scope' (by default, a new one) in this context, and in tasks and threads given a copy."""
+    token = _scope.set(object() if scope is None else scope)
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def install():
+    """Key Flask's context stacks by request scope; must run before the Flask-SQLAlchemy session is created."""
+    _request_ctx_stack.__ident_func__ = current_scope
+    _app_ctx_stack.__ident_func__ = current_scope
@@ -0,0 +1,188 @@
+"""
+Copyright ©2021. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from datetime import datetime, timezone
+import logging
+import re
+import secrets
+import threading
+import time
+
+from flask.sessions import SecureCookieSession, SecureCookieSessionInterface, session_json_serializer
+from sqlalchemy import text
+from squiggy.lib.cache import TTLCache
+
+"""Session handling: exempt paths, sliding expiry and the optional server-side (database) session store."""
+
+logger = logging.getLogger(__name__)
+
+
+class ExemptingSessionInterface(SecureCookieSessionInterface):
+    """Signed-cookie sessions, except that requests to SESSION_EXEMPT_PATHS get a null session.
+
+    A null session is never deserialized, verified or saved, so health probes and static assets cost no session work
+    and never receive a Set-Cookie.
+    """
+
+    def is_exempt(self, app, request):
+        return request.path.startswith(tuple(app.config['SESSION_EXEMPT_PATHS']))
+
+    def open_session(self, app, request):
+        if self.is_exempt(app, request):
+            return self.make_null_session(app)
+        return super().open_session(app, request)
+
+
+class ServerSideSession(SecureCookieSession):
+
+    def __init__(self, initial=None, sid=None):
+        super().__init__(initial)
+        self.sid = sid
+
+
+class DatabaseSessionInterface(ExemptingSessionInterface):
+    """Keep session data in the database, and only an opaque, random session id in the cookie.
+
+    Cookie size and per-request cost therefore stay constant however much the session holds. Reads go through a
+    per-process LRU cache; since another process may change a session, cached entries live only SESSION_CACHE_TTL
+    seconds. Expired rows are deleted in batches, on a background thread, at most every SESSION_CLEANUP_INTERVAL seconds.
+    """
+
+    session_class = ServerSideSession
+    sid_pattern = re.compile(r'^[A-Za-z0-9_-]{43}$')
+
+    def __init__(self, engine, app):
+        self.engine = engine
+        self.cache = TTLCache(app.config['SESSION_CACHE_SIZE'], app.config['SESSION_CACHE_TTL'])
+        self.cleanup_batch_size = app.config['SESSION_CLEANUP_BATCH_SIZE']
+        self.cleanup_interval = app.config['SESSION_CLEANUP_INTERVAL']
+        self._cleanup_lock = threading.Lock()
+        self._cleaned_up_at = time.monotonic()
+
+    def open_session(self, app, request):
+        if self.is_exempt(app, request):
+            return self.make_null_session(app)
+        sid = request.cookies.get(app.session_cookie_name)
+        data = self._load(sid) if sid and self.sid_pattern.match(sid) else None
+        if data is None:
+            return self.session_class(sid=secrets.token_urlsafe(32))
+        return self.session_class(data, sid=sid)
+
+    def save_session(self, app, session, response):
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if not session:
+            if session.modified:
+                self._delete(session.sid)
+                response.delete_cookie(app.session_cookie_name, domain=domain, path=path)
+            return
+        if session.accessed:
+            response.vary.add('Cookie')
+        if not self.should_set_cookie(app, session):
+            return
+        expires = self.get_expiration_time(app, session)
+        # Flask's expiration time is a naive UTC datetime.
+        expires_at = expires.replace(tzinfo=timezone.utc) if expires else datetime.now(timezone.utc) + app.permanent_session_lifetime
+        self._save(session.sid, dict(session), expires_at)
+        response.set_cookie(
+            app.session_cookie_name,
+            session.sid,
+            expires=expires,
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+        self._cleanup_if_due()
+
+    def cleanup(self):
+        """Delete expired sessions, in batches so as not to hold long locks; return the number deleted."""
+        sql = text("""DELETE FROM sessions WHERE id IN (
+            SELECT id FROM sessions WHERE expires_at < now() LIMIT :batch_size)""")
+        deleted = 0
+        while True:
+            with self.engine.begin() as connection:
+                count = connection.execute(sql, {'batch_size': self.cleanup_batch_size}).rowcount
+            deleted += count
+            if count < self.cleanup_batch_size:
+                return deleted
+
+    def _load(self, sid):
+        serialized = self.cache.get(sid)
+        if serialized is None:
+            sql = text('SELECT data FROM sessions WHERE id = :sid AND expires_at > now()')
+            with self.engine.connect() as connection:
+                serialized = connection.execute(sql, {'sid': sid}).scalar()
+            if serialized is None:
+                return None
+            self.cache.set(sid, serialized)
+        # The cache holds serialized data, so that no two requests share mutable session state.
+        return session_json_serializer.loads(serialized)
+
+    def _save(self, sid, data, expires_at):
+        serialized = session_json_serializer.dumps(data)
+        sql = text("""INSERT INTO sessions (id, data, expires_at, created_at, updated_at)
+            VALUES (:sid, :data, :expires_at, now(), now())
+            ON CONFLICT (id) DO UPDATE SET data = :data, expires_at = :expires_at, updated_at = now()""")
+        with self.engine.begin() as connection:
+            connection.execute(sql, {'sid': sid, 'data': serialized, 'expires_at': expires_at})
+        self.cache.set(sid, serialized)
+
+    def _delete(self, sid):
+        self.cache.delete(sid)
+        with self.engine.begin() as connection:
+            connection.execute(text('DELETE FROM sessions WHERE id = :sid'), {'sid': sid})
+
+    def _cleanup_if_due(self):
+        if time.monotonic() - self._cleaned_up_at < self.cleanup_interval or not self._cleanup_lock.acquire(blocking=False):
+            return
+        self._cleaned_up_at = time.monotonic()
+
+        def _cleanup():
+            try:
+                self.cleanup()
+            except Exception:
+                logger.exception('Failed to delete expired sessions')
+            finally:
+                self._cleanup_lock.release()
+        threading.Thread(target=_cleanup, name='squiggy-session-cleanup', daemon=True).start()
+
+
+def refresh_session(app, session):
+    """Slide the expiry of a non-empty session, re-issuing its cookie only once enough of its lifetime has elapsed.
+
+    The cookie is re-issued when SESSION_REFRESH_FRACTION of INACTIVE_SESSION_LIFETIME has passed since it was last
+    issued, so a session expires after between (1 - fraction) and 1 times the lifetime of inactivity. A fraction of 0
+    re-issues the cookie on every request.
+    """
+    if not session or app.session_interface.is_null_session(session):
+        return
+    if not session.permanent:
+        session.permanent = True
+    now = int(time.time())
+    refresh_interval = app.config['SESSION_REFRESH_FRACTION'] * app.permanent_session_lifetime.total_seconds()
+    if now - session.get('_refreshed_at', 0) >= refresh_interval:
+        session['_refreshed_at'] = now
@@ -0,0 +1,121 @@
+"""
+Copyright ©2021. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from contextlib import contextmanager, nullcontext
+import json
+import sys
+import threading
+import time
+
+"""Timing of app startup, phase by phase, and startup work left to background threads.
+
+create_app records its phases in a StartupTimer, kept in app.extensions. Run this module (as 'flask startup-profile'
+does) to time a cold start, imports included, in a fresh interpreter.
+"""
+
+
+class StartupTimer:
+
+    def __init__(self):
+        self.phases = []
+        self.started_at = time.perf_counter()
+        self._depth = 0
+
+    @contextmanager
+    def phase(self, name):
+        # Phases are listed in start order; nested phases are indented under their parent.
+        index = len(self.phases)
+        self.phases.append(None)
+        self._depth += 1
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            self.phases[index] = (name, self._depth, time.perf_counter() - started_at)
+
+    def total(self):
+        return time.perf_counter() - self.started_at
+
+    def to_api_json(self):
+        return [{'name': name, 'depth': depth, 'ms': seconds * 1000} for name, depth, seconds in self.phases]
+
+
+def startup_phase(app, name):
+    """Time a phase of create_app, if it is still starting up."""
+    timer = app.extensions.get('squiggy_startup_timer')
+    return timer.phase(name) if timer else nullcontext()
+
+
+def start_background_task(app, name, target):
+    """Run startup work on a daemon thread, which join_background_tasks can wait for."""
+    thread = threading.Thread(target=target, name=name, daemon=True)
+    app.extensions.setdefault('squiggy_background_tasks', []).append(thread)
+    thread.start()
+    return thread
+
+
+def join_background_tasks(app):
+    """Wait for startup work begun by start_background_task (e.g., before forking, which copies no threads)."""
+    for thread in app.extensions.pop('squiggy_background_tasks', []):
+        thread.join()
+
+
+def render_report(phases, import_times, limit):
+    """Format phases (as in StartupTimer.to_api_json) and the slowest of the '-X importtime' lines."""
+    imports = []
+    for line in import_times:
+        if line.startswith('import time:') and '|' in line:
+            self_us, cumulative_us, module = line[len('import time:'):].split('|')
+            if self_us.strip().isdigit():
+                imports.append((int(self_us), int(cumulative_us), module.strip()))
+    # The squiggy package (and with it Flask and SQLAlchemy) is imported before main() can start its timer.
+    package_ms = next((cumulative_us / 1000 for _, cumulative_us, module in imports if module == 'squiggy'), 0)
+    lines = [f'{"phase":<40}{"ms":>10}']
+    if package_ms:
+        lines.append(f"{'import squiggy':<40}{package_ms:>10.1f}")
+    for phase in phases:
+        ms = phase['ms'] + package_ms if phase['name'] == 'total' else phase['ms']
+        lines.append(f"{'  ' * phase['depth'] + phase['name']:<40}{ms:>10.1f}")
+    if imports and limit:
+        lines.append('')
+        lines.append(f'{"slowest imports (self time)":<50}{"self ms":>10}{"cumul. ms":>12}')
+        for self_us, cumulative_us, module in sorted(imports, reverse=True)[:limit]:
+            lines.append(f'{module:<50}{self_us / 1000:>10.1f}{cumulative_us / 1000:>12.1f}')
+    return '\n'.join(lines)
+
+
+def main():
+    timer = StartupTimer()
+    with timer.phase('import squiggy.factory'):
+        from squiggy.factory import create_app
+    app = create_app()
+    phases = timer.to_api_json() + app.extensions['squiggy_startup_timings']
+    phases.append({'name': 'total', 'depth': 0, 'ms': timer.total() * 1000})
+    json.dump(phases, sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
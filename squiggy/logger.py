@@ -24,8 +24,14 @@ ENHANCEMENTS, OR MODIFICATIONS.
 """
 
 
+import atexit
+import gzip
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import os
+import queue
+import shutil
+import threading
 
 
 def initialize_logger(app):
@@ -43,21 +49,136 @@ def initialize_logger(app):
 
     # If location is configured as "STDOUT", don't create a new log file.
     if location == 'STDOUT':
-        handlers = app.logger.handlers
+        handlers = list(app.logger.handlers)
     else:
-        file_handler = RotatingFileHandler(location, mode='a', maxBytes=1024 * 1024 * 100, backupCount=20)
-        handlers = [file_handler]
+        handlers = [_file_handler(app, location)]
 
     for handler in handlers:
         handler.setLevel(level)
         formatter = logging.Formatter(app.config['LOGGING_FORMAT'])
         handler.setFormatter(formatter)
 
+    if app.config['LOGGING_ASYNC']:
+        for handler in handlers:
+            app.logger.removeHandler(handler)
+        handlers = [_queue_handler(app, handlers)]
+
     for logger in loggers:
         for handler in handlers:
             logger.addHandler(handler)
             logger.setLevel(level)
 
+    # The structured access log (one JSON object per line) can be written to a file of its own.
+    access_log_location = app.config['ACCESS_LOG_LOCATION']
+    if access_log_location:
+        access_handler = logging.StreamHandler() if access_log_location == 'STDOUT' else _file_handler(app, access_log_location)
+        access_handler.setFormatter(logging.Formatter('%(message)s'))
+        access_logger = logging.getLogger('squiggy.access')
+        access_logger.addHandler(_queue_handler(app, [access_handler]) if app.config['LOGGING_ASYNC'] else access_handler)
+        access_logger.propagate = False
+
     logging.getLogger('boto3').setLevel(log_propagation_level)
     logging.getLogger('botocore').setLevel(log_propagation_level)
     logging.getLogger('s3transfer').setLevel(log_propagation_level)
+
+
+def restart_log_listeners(app):
+    """In a forked process, replace the async log listener threads (and their queues), which fork does not copy."""
+    for listener in app.extensions.get('squiggy_log_listeners', []):
+        queue_handler = listener.queue_handler
+        queue_handler.queue = listener.queue = queue.Queue(maxsize=app.config['LOGGING_QUEUE_SIZE'])
+        queue_handler.dropped = 0
+        queue_handler._dropped_lock = threading.Lock()
+        listener._thread = None
+        listener.start()
+
+
+def stop_log_listeners(app):
+    """Flush queued records; for a process that exits without running atexit handlers."""
+    for listener in app.extensions.get('squiggy_log_listeners', []):
+        if listener._thread:
+            listener.stop()
+
+
+def _file_handler(app, location):
+    file_handler = RotatingFileHandler(location, mode='a', maxBytes=1024 * 1024 * 100, backupCount=20)
+    if app.config['LOGGING_ASYNC']:
+        # Rotation happens on the listener thread, so compressing rotated files costs request threads nothing.
+        file_handler.namer = _gzip_namer
+        file_handler.rotator = _gzip_rotator
+    return file_handler
+
+
+def _queue_handler(app, handlers):
+    # Request threads only enqueue records; the listener thread formats and writes them.
+    queue_handler = DroppingQueueHandler(queue.Queue(maxsize=app.config['LOGGING_QUEUE_SIZE']))
+    listener = DropReportingQueueListener(queue_handler, *handlers)
+    listener.start()
+    atexit.register(listener.stop)
+    app.extensions.setdefault('squiggy_log_listeners', []).append(listener)
+    return queue_handler
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Enqueue log records without ever blocking the logging thread.
+
+    Drop policy: if the queue is full (i.e., the listener has fallen behind a slow disk) then the incoming record is
+    discarded and counted. The listener reports the number of discarded records once it catches up.
+    """
+
+    def __init__(self, _queue):
+        super().__init__(_queue)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def prepare(self, record):
+        # Merge args into the message now, while they are still bound to this request (ORM instances, 'current_user'
+        # and the like). Formatting is left to the listener thread. Records never leave the process, so unlike
+        # QueueHandler.prepare we need not copy the record or strip its exc_info to keep it pickleable.
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+    def pop_dropped(self):
+        with self._dropped_lock:
+            dropped, self.dropped = self.dropped, 0
+        return dropped
+
+
+class DropReportingQueueListener(QueueListener):
+
+    def __init__(self, queue_handler, *handlers):
+        super().__init__(queue_handler.queue, *handlers, respect_handler_level=True)
+        self.queue_handler = queue_handler
+
+    def handle(self, record):
+        dropped = self.queue_handler.pop_dropped()
+        if dropped:
+            super().handle(
+                logging.makeLogRecord(
+                    {
+                        'name': __name__,
+                        'levelno': logging.WARNING,
+                        'levelname': 'WARNING',
+                        'msg': f'Log queue was full: {dropped} record(s) dropped.',
+                    },
+                ),
+            )
+        super().handle(record)
+
+
+def _gzip_namer(name):
+    return f'{name}.gz'
+
+
+def _gzip_rotator(source, dest):
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
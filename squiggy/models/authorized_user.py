@@ -23,12 +23,22 @@ SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
 ENHANCEMENTS, OR MODIFICATIONS.
 """
 
-from sqlalchemy import text
+import csv
+from itertools import chain
+import threading
+
+from flask import current_app as app, has_app_context
+from flask_login import UserMixin
+from sqlalchemy import event, text
 from squiggy import db
+from squiggy.lib.model_cache import MISSING, ModelCache
 from squiggy.models.base import Base
 
+# Number of uids bound to each 'uid = ANY(:uids)' query.
+UID_BATCH_SIZE = 10000
+
 
-class AuthorizedUser(Base):
+class AuthorizedUser(Base, UserMixin):
     __tablename__ = 'authorized_users'
 
     id = db.Column(db.Integer, nullable=False, primary_key=True)  # noqa: A003
@@ -45,16 +55,139 @@ class AuthorizedUser(Base):
                     updated_at={self.updated_at}>
                 """
 
+    def to_api_json(self):
+        return _to_api_json(self)
+
     @classmethod
     def find_by_id(cls, db_id, include_deleted=False):
-        return cls.query.filter_by(id=db_id).first()
+        db_id = int(db_id)
+        return user_cache().fetch('id', db_id, lambda: cls.query.filter_by(id=db_id).first())
 
     @classmethod
     def find_by_uid(cls, uid):
-        return cls.query.filter_by(uid=uid).first()
+        return user_cache().fetch('uid', uid, lambda: cls.query.filter_by(uid=uid).first())
+
+    @classmethod
+    def bulk_upsert(cls, uids):
+        """Insert users by uid in one set-based statement, touching 'updated_at' of those that exist; the caller commits."""
+        uids = list(dict.fromkeys(uids))
+        if not uids:
+            return {'inserted': 0, 'updated': 0}
+        # xmax is zero only for rows that this statement inserted.
+        query = text("""INSERT INTO authorized_users (uid, created_at, updated_at)
+            SELECT uid, now(), now() FROM unnest(CAST(:uids AS VARCHAR[])) AS uid
+            ON CONFLICT (uid) DO UPDATE SET updated_at = now()
+            RETURNING id, uid, (xmax = 0) AS inserted""")
+        rows = db.session.execute(query, {'uids': uids}).fetchall()
+        cache = user_cache()
+        session = db.session()
+        for row in rows:
+            cache.invalidate('id', row['id'], session)
+            cache.invalidate('uid', row['uid'], session)
+        inserted = sum(1 for row in rows if row['inserted'])
+        return {'inserted': inserted, 'updated': len(rows) - inserted}
 
     @classmethod
     def get_id_per_uid(cls, uid):
-        query = text('SELECT id FROM authorized_users WHERE uid = :uid')
-        result = db.session.execute(query, {'uid': uid}).first()
-        return result and result['id']
+        user = cls.find_by_uid(uid)
+        return user and user.id
+
+    @classmethod
+    def get_ids_per_uid(cls, uids, warm_cache=False, batch_size=UID_BATCH_SIZE):
+        """Map each known uid to its user id, with one query per 'batch_size' uids not already cached."""
+        cache = user_cache()
+        ids_per_uid = {}
+        uncached = []
+        for uid in dict.fromkeys(uids):
+            values = cache.get_values('uid', uid)
+            if values is MISSING:
+                uncached.append(uid)
+            elif values:
+                ids_per_uid[uid] = values['id']
+        columns = ', '.join(cache.columns) if warm_cache else 'id, uid'
+        query = text(f'SELECT {columns} FROM authorized_users WHERE uid = ANY(:uids)')
+        for start in range(0, len(uncached), batch_size):
+            for row in db.session.execute(query, {'uids': uncached[start:start + batch_size]}):
+                ids_per_uid[row['uid']] = row['id']
+                if warm_cache:
+                    cache.put(row)
+        return ids_per_uid
+
+    @classmethod
+    def get_page(cls, after_id=None, limit=100):
+        """Return API JSON of up to 'limit' users with id greater than 'after_id', in id order.
+
+        Pages seek on the primary key rather than OFFSET, so any page costs the same, and rows are read as plain column
+        tuples rather than ORM instances, so nothing is added to the session's identity map.
+        """
+        query = db.session.query(cls.id, cls.uid, cls.created_at, cls.updated_at).order_by(cls.id)
+        if after_id is not None:
+            query = query.filter(cls.id > after_id)
+        return [_to_api_json(row) for row in query.limit(limit)]
+
+    @classmethod
+    def iter_all(cls, after_id=None, batch_size=1000):
+        """Yield API JSON of every user with id greater than 'after_id', one page of 'batch_size' at a time."""
+        while True:
+            page = cls.get_page(after_id=after_id, limit=batch_size)
+            yield from page
+            if len(page) < batch_size:
+                return
+            after_id = page[-1]['id']
+
+
+def uids_from_csv(csv_file):
+    """Yield the UIDs in a CSV file's 'uid' column if its first non-blank row names one (in any case), else in its first column."""
+    rows = (row for row in csv.reader(csv_file) if any(cell.strip() for cell in row))
+    first_row = next(rows, None)
+    if first_row is None:
+        return
+    header = [cell.strip().lower() for cell in first_row]
+    if 'uid' in header:
+        column = header.index('uid')
+    else:
+        column = 0
+        rows = chain([first_row], rows)
+    for row in rows:
+        uid = row[column].strip() if len(row) > column else None
+        if uid:
+            yield uid
+
+
+def _to_api_json(user):
+    return {
+        'id': user.id,
+        'uid': user.uid,
+        'isAdmin': AuthorizedUser.is_admin,
+        'createdAt': user.created_at and user.created_at.isoformat(),
+        'updatedAt': user.updated_at and user.updated_at.isoformat(),
+    }
+
+
+_user_cache_lock = threading.Lock()
+
+
+def user_cache():
+    """Per-app cache of AuthorizedUser lookups by id and uid."""
+    cache = app.extensions.get('squiggy_user_cache')
+    if cache is None:
+        with _user_cache_lock:
+            cache = app.extensions.get('squiggy_user_cache')
+            if cache is None:
+                cache = app.extensions['squiggy_user_cache'] = ModelCache(
+                    AuthorizedUser,
+                    keys=('id', 'uid'),
+                    maxsize=app.config['USER_CACHE_SIZE'],
+                    ttl=app.config['USER_CACHE_TTL'],
+                    negative_ttl=app.config['USER_CACHE_NEGATIVE_TTL'],
+                )
+    return cache
+
+
+@event.listens_for(AuthorizedUser, 'after_insert')
+@event.listens_for(AuthorizedUser, 'after_update')
+@event.listens_for(AuthorizedUser, 'after_delete')
+def _after_write(mapper, connection, target):
+    # Registered once per process; writes outside an app context (e.g., scripts) have no cache to invalidate.
+    if has_app_context():
+        user_cache().after_write(target)
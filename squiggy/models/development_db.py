@@ -23,9 +23,14 @@ SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
 ENHANCEMENTS, OR MODIFICATIONS.
 """
 
+from contextlib import contextmanager
+
 from flask import current_app as app
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
 from sqlalchemy.sql import text
 from squiggy import db, std_commit
+from squiggy.lib.migrations import clone_from_template, fingerprint, load_migrations, migrate
 from squiggy.models.authorized_user import AuthorizedUser
 
 
@@ -39,25 +44,64 @@ _test_users = [
 def clear():
     with open(app.config['BASE_DIR'] + '/scripts/db/drop_schema.sql', 'r') as ddlfile:
         db.session().execute(text(ddlfile.read()))
-        std_commit()
+        std_commit(allow_test_environment=True)
 
 
 def load():
-    _load_schemas()
+    """Apply pending migrations and seed data; safe to run against a database that is already loaded."""
+    migrate(db.engine, _migrations())
     _create_users()
     return db
 
 
-def _load_schemas():
-    """Create DB schema from SQL file."""
-    with open(app.config['BASE_DIR'] + '/scripts/db/schema.sql', 'r') as ddlfile:
-        db.session().execute(text(ddlfile.read()))
-        std_commit()
+def reset():
+    """Replace all tables and data with a freshly migrated and seeded schema.
+
+    With DB_TEMPLATE_ENABLED, the database itself is replaced by a clone of a template database, which is built only when
+    migrations or seed data have changed.
+    """
+    if not app.config['DB_TEMPLATE_ENABLED']:
+        clear()
+        return load()
+    # The database cannot be dropped while any pooled connection is open.
+    db.session.remove()
+    db.engine.dispose()
+    clone_from_template(
+        app.config['SQLALCHEMY_DATABASE_URI'],
+        build=_build_template,
+        build_fingerprint=fingerprint(_migrations(), _test_users),
+        template_name=app.config['DB_TEMPLATE_NAME'],
+    )
+    return db
+
+
+def _build_template(template_uri):
+    engine = create_engine(template_uri, poolclass=NullPool)
+    try:
+        migrate(engine, _migrations())
+        with _session_bound_to(engine):
+            _create_users()
+    finally:
+        engine.dispose()
+
+
+def _migrations():
+    return load_migrations(app.config['BASE_DIR'] + '/scripts/db/migrations')
+
+
+@contextmanager
+def _session_bound_to(engine):
+    session = db.session
+    db.session = db.create_scoped_session(options={'bind': engine, 'binds': {}})
+    try:
+        yield
+    finally:
+        db.session.remove()
+        db.session = session
 
 
 def _create_users():
-    for test_user in _test_users:
-        db.session.add(AuthorizedUser(uid=test_user['uid']))
+    AuthorizedUser.bulk_upsert(test_user['uid'] for test_user in _test_users)
     std_commit(allow_test_environment=True)
 
 
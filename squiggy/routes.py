@@ -25,21 +25,48 @@ ENHANCEMENTS, OR MODIFICATIONS.
 
 import datetime
 
-from flask import make_response, redirect, request, session
+from flask import redirect, request, session
+from squiggy import db
+from squiggy.lib import metrics
+from squiggy.lib.compression import compress_response
+from squiggy.lib.file_cache import FileCache
+from squiggy.lib.http import PrecompressedDocument, precompute_static_responses
+from squiggy.lib.profiling import start_profiling, stop_profiling
+from squiggy.lib.request_metrics import check_query_budget, instrument_db, log_access, start_request
+from squiggy.lib.sessions import DatabaseSessionInterface, ExemptingSessionInterface, refresh_session
+from squiggy.lib.startup import start_background_task, startup_phase
 
 
 def register_routes(app):
 
-    # Register API routes.
-    import squiggy.api.auth_controller
-    import squiggy.api.config_controller
-    import squiggy.api.status_controller
-    import squiggy.api.user_controller
+    with startup_phase(app, 'import_controllers'):
+        # Register API routes.
+        import squiggy.api.auth_controller
+        import squiggy.api.config_controller
+        import squiggy.api.status_controller
+        import squiggy.api.user_controller
 
-    # Register error handlers.
-    import squiggy.api.error_handlers
+        # Register error handlers.
+        import squiggy.api.error_handlers
 
-    index_html = open(app.config['INDEX_HTML']).read()
+    index_html = FileCache(
+        app.config['INDEX_HTML'],
+        lambda data: PrecompressedDocument(data, mimetype='text/html'),
+        app.config['FILE_CACHE_CHECK_INTERVAL'],
+    )
+
+    def _warm_up():
+        # Render deployment-constant API payloads, and their ETags, once.
+        precompute_static_responses(app)
+        index_html.get()
+
+    if app.config['FAST_START_ENABLED']:
+        # Serve sooner; a front end that has not been built is then reported by the first request for it.
+        start_background_task(app, 'squiggy-warm-up', _log_errors(app, _warm_up))
+    else:
+        # Fail fast if the front end has not been built.
+        with startup_phase(app, 'warm_up'):
+            _warm_up()
 
     # Unmatched API routes return a 404.
     @app.route('/api/<path:path>')
@@ -52,16 +79,26 @@ def register_routes(app):
     @app.route('/<path:path>')
     def front_end_route(**kwargs):
         vue_base_url = app.config['VUE_LOCALHOST_BASE_URL']
-        return redirect(vue_base_url + request.full_path) if vue_base_url else make_response(index_html)
+        return redirect(vue_base_url + request.full_path) if vue_base_url else index_html.get().to_response()
+
+    instrument_db()
+
+    if app.config['SESSION_BACKEND'] == 'database':
+        app.session_interface = DatabaseSessionInterface(db.engine, app)
+    else:
+        app.session_interface = ExemptingSessionInterface()
+    app.permanent_session_lifetime = datetime.timedelta(minutes=app.config['INACTIVE_SESSION_LIFETIME'])
 
     @app.before_request
     def before_request():
-        session.permanent = True
-        app.permanent_session_lifetime = datetime.timedelta(minutes=app.config['INACTIVE_SESSION_LIFETIME'])
-        session.modified = True
+        start_request()
+        metrics.start_request()
+        start_profiling(app)
 
     @app.after_request
     def after_api_request(response):
+        response = stop_profiling(app, response)
+        refresh_session(app, session)
         if app.config['SQUIGGY_ENV'] == 'development':
             # In development the response can be shared with requesting code from any local origin.
             response.headers['Access-Control-Allow-Headers'] = 'Content-Type'
@@ -69,16 +106,23 @@ def register_routes(app):
             response.headers['Access-Control-Allow-Credentials'] = 'true'
             response.headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS, PUT, DELETE'
         if request.full_path.startswith('/api'):
-            log_message = ' '.join([
-                request.remote_addr,
-                request.method,
-                request.full_path,
-                response.status,
-            ])
-            if response.status_code >= 500:
-                app.logger.error(log_message)
-            elif response.status_code >= 400:
-                app.logger.warning(log_message)
-            else:
-                app.logger.debug(log_message)
+            response = compress_response(app, response)
+        metrics.end_request(response)
+        log_access(app, response)
+        check_query_budget(app)
         return response
+
+    @app.teardown_request
+    def teardown_request(exception=None):
+        # Never leave a profiler running, even if an after-request hook failed.
+        stop_profiling(app)
+        metrics.finish_request()
+
+
+def _log_errors(app, func):
+    def _func():
+        try:
+            func()
+        except Exception as e:
+            app.logger.error(f'Warm-up failed: {e}')
+    return _func
@@ -26,20 +26,43 @@ ENHANCEMENTS, OR MODIFICATIONS.
 import os
 os.environ['SQUIGGY_ENV'] = 'test'  # noqa
 
+from flask import Flask  # noqa
 from moto import mock_sts  # noqa
 import pytest  # noqa
+from sqlalchemy.engine.url import make_url  # noqa
+from squiggy.configs import load_configs  # noqa
 import squiggy.factory  # noqa
 
 
-# Because app and db fixtures are only created once per pytest run, individual tests
-# are not able to modify application configuration values before the app is created.
-# Per-test customizations could be supported via a fixture scope of 'function' and
-# the @pytest.mark.parametrize annotation.
+# The app and db fixtures are created once per pytest process. Configuration that must be in place before the app is
+# created is passed to create_app (see worker_config); individual tests change config values with
+# tests.util.override_config.
+#
+# Tests can run in parallel with pytest-xdist ('tox -e test -- -n auto -p no:warnings tests'). Each worker process
+# gets its own database, cloned from a template database shared by all workers, and drops it when done.
 
 @pytest.fixture(scope='session')
-def app(request):
+def worker_config():
+    """Config overrides for this pytest-xdist worker, if any."""
+    worker = os.environ.get('PYTEST_XDIST_WORKER')
+    if not worker:
+        return {}
+    configs = Flask('squiggy')
+    load_configs(configs)
+    url = make_url(configs.config['SQLALCHEMY_DATABASE_URI'])
+    template_name = configs.config['DB_TEMPLATE_NAME'] or f'{url.database}_template'
+    url.database = f'{url.database}_{worker}'
+    return {
+        'DB_TEMPLATE_ENABLED': True,
+        'DB_TEMPLATE_NAME': template_name,
+        'SQLALCHEMY_DATABASE_URI': str(url),
+    }
+
+
+@pytest.fixture(scope='session')
+def app(request, worker_config):
     """Fixture application object, shared by all tests."""
-    _app = squiggy.factory.create_app()
+    _app = squiggy.factory.create_app(config_overrides=worker_config)
 
     # Create app context before running tests.
     ctx = _app.app_context()
@@ -53,17 +76,19 @@ def app(request):
     return _app
 
 
-# TODO Perform DB schema creation and deletion outside an app context, enabling test-specific app configurations.
 @pytest.fixture(scope='session')
-def db(app):
+def db(app, worker_config):
     """Fixture database object, shared by all tests."""
+    from squiggy.lib.migrations import drop_database
     from squiggy.models import development_db
-    # Drop all tables before re-loading the schemas.
-    # If we dropped at teardown instead, an interrupted test run would block the next test run.
-    development_db.clear()
-    _db = development_db.load()
-
-    return _db
+    # Reset the database before, not after, tests: an interrupted test run would otherwise block the next test run.
+    _db = development_db.reset()
+    yield _db
+    # A worker's database is of no use once its tests are done.
+    if worker_config:
+        _close_session(_db)
+        _db.engine.dispose()
+        drop_database(app.config['SQLALCHEMY_DATABASE_URI'])
 
 
 @pytest.fixture(scope='function', autouse=True)
@@ -77,13 +102,10 @@ def db_session(db):
     # we begin by cleaning up any previous invocations.
     # This fixture is marked 'autouse' to ensure that cleanup happens at the start of every test, whether
     # or not it has an explicit database dependency.
-    db.session.rollback()
-    try:
-        db.session.get_bind().close()
-    # The session bind will close only if it was provided a specific connection via this fixture.
-    except AttributeError:
-        pass
-    db.session.remove()
+    _close_session(db)
+    # Rows cached by a previous test may have been rolled back.
+    from squiggy.models.authorized_user import user_cache
+    user_cache().clear()
 
     connection = db.engine.connect()
     options = dict(bind=connection, binds={})
@@ -93,6 +115,16 @@ def db_session(db):
     return _session
 
 
+def _close_session(db):
+    db.session.rollback()
+    try:
+        db.session.get_bind().close()
+    # The session bind will close only if it was provided a specific connection via this fixture.
+    except AttributeError:
+        pass
+    db.session.remove()
+
+
 @pytest.fixture(scope='session', autouse=True)
 def fake_sts(app):
     """Fake the AWS security token service used to deliver S3 content (photos, note attachments)."""
@@ -42,3 +42,19 @@ class TestConfigController:
         assert response.status_code == 200
         assert 'version' in response.json
         assert 'build' in response.json
+
+    def test_not_modified(self, client):
+        """Answers a matching If-None-Match with 304."""
+        for path in ['/api/config', '/api/version']:
+            response = client.get(path)
+            assert response.status_code == 200
+            assert 'no-cache' in response.headers['Cache-Control']
+            etag = response.headers['ETag']
+            assert etag and not etag.startswith('W/')
+            response = client.get(path, headers={'If-None-Match': etag})
+            assert response.status_code == 304
+            assert response.headers['ETag'] == etag
+            assert not response.data
+            response = client.get(path, headers={'If-None-Match': '"stale"'})
+            assert response.status_code == 200
+            assert response.json
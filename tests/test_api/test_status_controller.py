@@ -23,6 +23,11 @@ SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
 ENHANCEMENTS, OR MODIFICATIONS.
 """
 
+from sqlalchemy.pool import NullPool
+from squiggy import db
+from squiggy.lib.db_pool import engine_options, warm_pool
+from tests.util import login_as, override_config
+
 
 class TestStatusController:
     """Status API."""
@@ -33,3 +38,78 @@ class TestStatusController:
         assert response.status_code == 200
         assert response.json['app'] is True
         assert response.json['db'] is True
+
+    def test_liveness(self, client):
+        """Reports liveness without checking dependencies."""
+        response = client.get('/api/live')
+        assert response.status_code == 200
+        assert response.json == {'app': True}
+
+    def test_readiness(self, client):
+        """Reports readiness, including the database."""
+        response = client.get('/api/ready')
+        assert response.status_code == 200
+        assert response.json == {'app': True, 'db': True}
+
+    def test_metrics(self, app, client):
+        """Exposes request, error and connection-pool metrics in Prometheus format."""
+        client.get('/api/ping')
+        client.get('/api/no/such/thing')
+        with override_config(app, 'METRICS_AUTH_TOKEN', 'sesame'):
+            response = client.get('/api/metrics', headers={'Authorization': 'Bearer sesame'})
+        assert response.status_code == 200
+        assert response.mimetype == 'text/plain'
+        text = response.get_data(as_text=True)
+        assert 'squiggy_http_requests_total{route="/api/ping",method="GET",status="200"}' in text
+        assert 'squiggy_http_errors_total{handler="handle_resource_not_found"}' in text
+        assert 'squiggy_http_request_duration_seconds_bucket{route="/api/ping",method="GET",le="+Inf"}' in text
+        assert 'squiggy_http_requests_in_flight 1' in text
+        assert 'squiggy_db_pool_checked_out' in text
+        assert 'squiggy_db_pool_waits_total' in text
+
+    def test_metrics_token(self, app, client):
+        """Requires the configured bearer token, and refuses every request if none is configured."""
+        assert client.get('/api/metrics').status_code == 401
+        assert client.get('/api/metrics', headers={'Authorization': 'Bearer None'}).status_code == 401
+        with override_config(app, 'METRICS_AUTH_TOKEN', 'sesame'):
+            assert client.get('/api/metrics').status_code == 401
+            assert client.get('/api/metrics', headers={'Authorization': 'Bearer sesam'}).status_code == 401
+            response = client.get('/api/metrics', headers={'Authorization': 'Bearer sesame'})
+            assert response.status_code == 200
+
+    def test_db_pool_anonymous(self, client):
+        """Denies anonymous access to pool stats."""
+        assert client.get('/api/admin/db_pool').status_code == 401
+
+    def test_db_pool(self, client):
+        """Reports connection-pool utilization to admins."""
+        login_as(client, '2040')
+        response = client.get('/api/admin/db_pool')
+        assert response.status_code == 200
+        assert response.json['poolClass'] == 'InstrumentedQueuePool'
+        assert response.json['size'] == 5
+        assert response.json['maxOverflow'] == 10
+        assert response.json['checkedOut'] >= 0
+        assert 0 <= response.json['utilization'] <= 1
+        assert response.json['transactionPoolerMode'] is False
+
+    def test_engine_options(self, app):
+        """Configures the pool and per-connection settings."""
+        with override_config(app, 'SQLALCHEMY_ENGINE_OPTIONS', {}):
+            options = engine_options(app)
+        assert options['pool_size'] == 5
+        assert options['pool_pre_ping'] is True
+        assert options['connect_args'] == {'application_name': 'squiggy', 'options': '-c statement_timeout=30000'}
+        with override_config(app, 'SQLALCHEMY_ENGINE_OPTIONS', {}), override_config(app, 'DB_TRANSACTION_POOLER_MODE', True):
+            options = engine_options(app)
+            assert options['poolclass'] is NullPool
+            assert 'pool_size' not in options
+            assert options['connect_args'] == {'application_name': 'squiggy'}
+
+    def test_warm_pool(self, app):
+        """Opens pooled connections in the background, if configured."""
+        assert warm_pool(app, db.engine) is None
+        with override_config(app, 'DB_POOL_WARM_CONNECTIONS', 2):
+            thread = warm_pool(app, db.engine)
+            thread.join(5)
+        assert db.engine.pool.checkedin() >= 2
@@ -0,0 +1,85 @@
+"""
+Copyright ©2021. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from squiggy import std_commit
+from squiggy.models.authorized_user import AuthorizedUser
+from tests.util import login_as, override_config
+
+
+class TestGetUsers:
+    """Users API."""
+
+    def test_anonymous(self, client):
+        """Denies anonymous access."""
+        assert client.get('/api/users').status_code == 401
+
+    def test_bad_params(self, client):
+        """Rejects a non-numeric 'after' or 'limit', or a non-positive 'limit'."""
+        login_as(client, '2040')
+        assert client.get('/api/users?limit=0').status_code == 400
+        assert client.get('/api/users?after=abc').status_code == 400
+        assert client.get('/api/users?after=-1').status_code == 400
+        assert client.get('/api/users?after=0').status_code == 200
+
+    def test_keyset_pagination(self, client):
+        """Pages through all users, in id order, by 'nextAfter'."""
+        AuthorizedUser.bulk_upsert([f'user_{index}' for index in range(5)])
+        std_commit()
+        login_as(client, '2040')
+        uids = []
+        # A cursor of zero starts from the beginning.
+        after = '&after=0'
+        while True:
+            response = client.get(f'/api/users?limit=2{after}')
+            assert response.status_code == 200
+            assert len(response.json['users']) <= 2
+            uids.extend(user['uid'] for user in response.json['users'])
+            if response.json['nextAfter'] is None:
+                break
+            after = f"&after={response.json['nextAfter']}"
+        assert uids[0] == '2040'
+        assert uids[1:] == [f'user_{index}' for index in range(5)]
+
+    def test_limit_cap(self, app, client):
+        """Caps 'limit' at USERS_PAGE_SIZE_MAX."""
+        AuthorizedUser.bulk_upsert(['user_0', 'user_1'])
+        std_commit()
+        login_as(client, '2040')
+        with override_config(app, 'USERS_PAGE_SIZE_MAX', 2):
+            response = client.get('/api/users?limit=1000')
+        assert len(response.json['users']) == 2
+        assert response.json['nextAfter'] == response.json['users'][-1]['id']
+
+    def test_stream(self, app, client):
+        """Streams every user as a JSON array."""
+        AuthorizedUser.bulk_upsert([f'user_{index}' for index in range(5)])
+        std_commit()
+        login_as(client, '2040')
+        with override_config(app, 'USERS_PAGE_SIZE_MAX', 2):
+            response = client.get('/api/users?stream=true')
+            assert response.is_streamed
+            users = response.json
+        assert [user['uid'] for user in users] == ['2040'] + [f'user_{index}' for index in range(5)]
+        assert users[0]['isAdmin'] is True
@@ -0,0 +1,59 @@
+"""
+Copyright ©2021. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import os
+
+from squiggy.configs import load_env_file
+
+
+class TestLoadEnvFile:
+    """Environment variables from a shell env file."""
+
+    def test_plain_assignments(self, monkeypatch, tmp_path):
+        """Parses quoted and unquoted exports without a subprocess."""
+        env_file = tmp_path / 'env'
+        env_file.write_text('# Comment\nexport SQUIGGY_TEST_A="one two"\nexport SQUIGGY_TEST_B=three\nSQUIGGY_TEST_C=\'#four\'\n')
+        monkeypatch.setattr('subprocess.run', None)
+        for key in ('SQUIGGY_TEST_A', 'SQUIGGY_TEST_B', 'SQUIGGY_TEST_C'):
+            monkeypatch.delenv(key, raising=False)
+        load_env_file(str(env_file))
+        assert os.environ['SQUIGGY_TEST_A'] == 'one two'
+        assert os.environ['SQUIGGY_TEST_B'] == 'three'
+        assert os.environ['SQUIGGY_TEST_C'] == '#four'
+
+    def test_shell_expansion(self, monkeypatch, tmp_path):
+        """Leaves expansion to bash."""
+        env_file = tmp_path / 'env'
+        env_file.write_text('export SQUIGGY_TEST_A=one\nexport SQUIGGY_TEST_B="${SQUIGGY_TEST_A}-two"\n')
+        monkeypatch.delenv('SQUIGGY_TEST_A', raising=False)
+        monkeypatch.delenv('SQUIGGY_TEST_B', raising=False)
+        load_env_file(str(env_file))
+        assert os.environ['SQUIGGY_TEST_B'] == 'one-two'
+
+    def test_missing_file(self, tmp_path):
+        """Ignores a missing file."""
+        environ = dict(os.environ)
+        load_env_file(str(tmp_path / 'no_such_env'))
+        assert dict(os.environ) == environ
@@ -0,0 +1,314 @@
+"""
+Copyright ©2021. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from http.client import HTTPConnection, IncompleteRead
+import json
+import socket
+import threading
+import time
+
+import flask
+from flask import Flask, g, request, Response
+import pytest
+from sqlalchemy import create_engine
+from squiggy import db
+from squiggy.api.errors import BadRequestError
+from squiggy.lib import async_server
+from squiggy.lib.async_server import AsyncWSGIServer
+from squiggy.lib.async_views import async_view, run_sync
+from squiggy.lib.http import tolerant_jsonify, tolerant_jsonify_stream
+from squiggy.models.authorized_user import AuthorizedUser
+from tests.util import override_config
+
+
+@async_view
+async def _sleep_view():
+    await asyncio.sleep(float(request.args['seconds']))
+    return tolerant_jsonify({'path': request.path})
+
+
+@async_view
+async def _user_view(uid):
+    user = await run_sync(AuthorizedUser.query.filter_by(uid=uid).first)
+    return tolerant_jsonify({'uid': user.uid, 'attached': user in db.session, 'queries': g.query_stats.count})
+
+
+@async_view
+async def _user_then_sleep_view(uid):
+    user = await run_sync(AuthorizedUser.query.filter_by(uid=uid).first)
+    await asyncio.sleep(float(request.args['seconds']))
+    return tolerant_jsonify({'uid': user.uid, 'attached': user in db.session})
+
+
+@async_view
+async def _failing_view():
+    await asyncio.sleep(0)
+    raise BadRequestError('Nope')
+
+
+@async_view
+async def _unexpected_error_view():
+    await asyncio.sleep(0)
+    raise RuntimeError('Oops')
+
+
+def _failing_stream_view():
+    def _chunks():
+        yield b'[1'
+        raise RuntimeError('Stream failed')
+    return Response(_chunks(), mimetype='application/json')
+
+
+@pytest.fixture(scope='module')
+def async_routes(app):
+    if 'test_async_sleep' not in app.view_functions:
+        app.add_url_rule('/api/test/async/sleep', 'test_async_sleep', _sleep_view)
+        app.add_url_rule('/api/test/async/user/<uid>', 'test_async_user', _user_view)
+        app.add_url_rule('/api/test/async/user/<uid>/sleep', 'test_async_user_sleep', _user_then_sleep_view)
+        app.add_url_rule('/api/test/async/failing', 'test_async_failing', _failing_view)
+        app.add_url_rule('/api/test/async/stream', 'test_async_stream', lambda: tolerant_jsonify_stream(range(10000)))
+        app.add_url_rule('/api/test/async/echo', 'test_async_echo', lambda: tolerant_jsonify(request.get_json()), methods=['POST'])
+        app.add_url_rule('/api/test/async/unexpected_error', 'test_async_unexpected_error', _unexpected_error_view)
+        app.add_url_rule('/api/test/async/failing_stream', 'test_async_failing_stream', _failing_stream_view)
+
+
+@pytest.fixture()
+def server_port(app, async_routes):
+    with _serving(app) as (server, port):
+        yield port
+
+
+@contextmanager
+def _serving(app, max_requests=0):
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1024)
+    server = AsyncWSGIServer('127.0.0.1', app, listener.fileno(), threads=2, max_requests=max_requests)
+    thread = threading.Thread(target=server.serve)
+    thread.start()
+    try:
+        yield server, listener.getsockname()[1]
+    finally:
+        server.stop()
+        thread.join(10)
+        listener.close()
+    assert not thread.is_alive()
+
+
+def _exchange(port, data, read_until_closed=True):
+    """Send raw bytes and return what the server sends back, up to the close of the connection or a one-second lull."""
+    with socket.create_connection(('127.0.0.1', port), timeout=1 if not read_until_closed else 10) as client:
+        client.sendall(data)
+        received = b''
+        while True:
+            try:
+                chunk = client.recv(65536)
+            except socket.timeout:
+                return received
+            if not chunk:
+                return received
+            received += chunk
+
+
+class TestAsyncServer:
+    """Asyncio worker of the prefork server."""
+
+    def test_concurrent_slow_requests(self, server_port):
+        """Holds many more slow async requests at once than it has threads."""
+        def _get(_):
+            connection = HTTPConnection('127.0.0.1', server_port, timeout=10)
+            connection.request('GET', '/api/test/async/sleep?seconds=0.5')
+            return connection.getresponse().status
+
+        started_at = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=100) as executor:
+            statuses = list(executor.map(_get, range(100)))
+        assert statuses == [200] * 100
+        # With two request threads, one thread per request would take 25 seconds.
+        assert time.perf_counter() - started_at < 5
+
+    def test_concurrent_db_requests(self, app, monkeypatch, server_port):
+        """Holds many more requests that have queried the database than the connection pool has connections."""
+        engine = create_engine(app.config['SQLALCHEMY_DATABASE_URI'], pool_size=2, max_overflow=0, pool_timeout=1)
+        monkeypatch.setattr(db, 'session', db.create_scoped_session(options={'bind': engine, 'binds': {}}))
+
+        def _get(_):
+            connection = HTTPConnection('127.0.0.1', server_port, timeout=10)
+            connection.request('GET', '/api/test/async/user/2040/sleep?seconds=2')
+            response = connection.getresponse()
+            return response.status, json.loads(response.read())
+
+        try:
+            # Outside tests, std_commit commits, and so ends the transaction that holds a connection.
+            with override_config(app, 'TESTING', False), ThreadPoolExecutor(max_workers=10) as executor:
+                results = list(executor.map(_get, range(10)))
+            assert results == [(200, {'uid': '2040', 'attached': True})] * 10
+            assert engine.pool.checkedout() == 0
+        finally:
+            engine.dispose()
+
+    def test_keep_alive(self, server_port):
+        """Serves sync and async views, and streams, on one connection."""
+        connection = HTTPConnection('127.0.0.1', server_port, timeout=10)
+        connection.request('GET', '/api/ping')
+        response = connection.getresponse()
+        assert json.loads(response.read()) == {'app': True, 'db': True}
+        connection.request('GET', '/api/test/async/sleep?seconds=0')
+        assert json.loads(connection.getresponse().read()) == {'path': '/api/test/async/sleep'}
+        connection.request('GET', '/api/test/async/stream')
+        response = connection.getresponse()
+        assert response.getheader('Transfer-Encoding') == 'chunked'
+        assert json.loads(response.read()) == list(range(10000))
+        connection.request('GET', '/api/test/async/failing')
+        response = connection.getresponse()
+        assert response.status == 400
+        assert json.loads(response.read())['message'] == 'Nope'
+
+    def test_run_sync(self, server_port):
+        """Runs blocking calls in the request's context: same DB session, same query count."""
+        connection = HTTPConnection('127.0.0.1', server_port, timeout=10)
+        connection.request('GET', '/api/test/async/user/2040')
+        assert json.loads(connection.getresponse().read()) == {'uid': '2040', 'attached': True, 'queries': 1}
+
+    def test_bad_request(self, app, server_port):
+        """Rejects malformed, oversized and chunked requests, and closes the connection."""
+        cases = [
+            (b'NONSENSE\r\n\r\n', b'400'),
+            (b'GET / HTTP/2.0\r\n\r\n', b'400'),
+            (b'GET / HTTP/1.1\r\nNo colon\r\n\r\n', b'400'),
+            (b'POST / HTTP/1.1\r\nContent-Length: many\r\n\r\n', b'400'),
+            (b'POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n', b'411'),
+            (b'POST / HTTP/1.1\r\nContent-Length: 1000001\r\n\r\n', b'413'),
+            (b'GET / HTTP/1.1\r\nX-Padding: ' + b'x' * async_server.MAX_HEADER_SIZE + b'\r\n\r\n', b'431'),
+        ]
+        with override_config(app, 'MAX_CONTENT_LENGTH', 1000000):
+            for head, status in cases:
+                response = _exchange(server_port, head)
+                assert response.split(b' ')[1] == status
+                assert b'Connection: close' in response
+
+    def test_request_body(self, server_port):
+        """Reads a request body of the given Content-Length, after a 100 Continue if the client expects one."""
+        body = json.dumps({'uids': ['2040']}).encode('utf-8')
+        head = (
+            b'POST /api/test/async/echo HTTP/1.1\r\nContent-Type: application/json\r\nExpect: 100-continue\r\n'
+            b'Connection: close\r\nContent-Length: %d\r\n\r\n' % len(body)
+        )
+        with socket.create_connection(('127.0.0.1', server_port), timeout=10) as client:
+            client.sendall(head)
+            assert client.recv(1024) == b'HTTP/1.1 100 Continue\r\n\r\n'
+            client.sendall(body)
+            response = b''.join(iter(lambda: client.recv(65536), b''))
+        assert response.startswith(b'HTTP/1.1 200 OK\r\n')
+        assert json.loads(response.split(b'\r\n\r\n', 1)[1]) == {'uids': ['2040']}
+
+    def test_http_1_0(self, server_port):
+        """Keeps an HTTP/1.0 connection open only if asked, and ends a stream of unknown length by closing it."""
+        response = _exchange(server_port, b'GET /api/live HTTP/1.0\r\n\r\n')
+        assert b'Connection: close\r\n' in response
+        assert response.endswith(b'{"app":true}')
+        response = _exchange(server_port, b'GET /api/live HTTP/1.0\r\nConnection: keep-alive\r\n\r\n', read_until_closed=False)
+        assert b'Connection: keep-alive\r\n' in response
+        response = _exchange(server_port, b'GET /api/test/async/stream HTTP/1.0\r\nConnection: keep-alive\r\n\r\n')
+        head, body = response.split(b'\r\n\r\n', 1)
+        assert b'Transfer-Encoding' not in head
+        assert b'Connection: close' in head
+        assert json.loads(body) == list(range(10000))
+
+    def test_pipelined_requests(self, server_port):
+        """Answers requests sent back to back on one connection, in order."""
+        requests = (
+            b'GET /api/test/async/sleep?seconds=0.1 HTTP/1.1\r\nHost: x\r\n\r\n'
+            b'GET /api/live HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n'
+        )
+        response = _exchange(server_port, requests)
+        assert response.count(b'HTTP/1.1 200 OK') == 2
+        assert response.index(b'"/api/test/async/sleep"') < response.index(b'{"app":true}')
+
+    def test_unexpected_error(self, server_port):
+        """Hands an async view's unexpected error to the app's error handler, and keeps the connection."""
+        connection = HTTPConnection('127.0.0.1', server_port, timeout=10)
+        connection.request('GET', '/api/test/async/unexpected_error')
+        response = connection.getresponse()
+        assert response.status == 500
+        assert json.loads(response.read()) == {'message': 'An unexpected server error occurred.'}
+        connection.request('GET', '/api/live')
+        assert connection.getresponse().status == 200
+
+    def test_failing_stream(self, server_port):
+        """Closes the connection, leaving the chunked response unterminated, if a stream fails partway."""
+        connection = HTTPConnection('127.0.0.1', server_port, timeout=10)
+        connection.request('GET', '/api/test/async/failing_stream')
+        response = connection.getresponse()
+        assert response.status == 200
+        with pytest.raises(IncompleteRead):
+            response.read()
+        connection = HTTPConnection('127.0.0.1', server_port, timeout=10)
+        connection.request('GET', '/api/live')
+        assert connection.getresponse().status == 200
+
+    def test_keep_alive_timeout(self, monkeypatch, server_port):
+        """Closes a keep-alive connection left idle for KEEPALIVE_TIMEOUT seconds."""
+        monkeypatch.setattr(async_server, 'KEEPALIVE_TIMEOUT', 0.2)
+        with socket.create_connection(('127.0.0.1', server_port), timeout=10) as client:
+            client.sendall(b'GET /api/live HTTP/1.1\r\nHost: x\r\n\r\n')
+            assert client.recv(65536).startswith(b'HTTP/1.1 200 OK')
+            assert client.recv(65536) == b''
+
+    def test_graceful_stop(self, app, async_routes):
+        """Finishes in-flight requests when stopped, closing their connections, and closes idle connections."""
+        with _serving(app) as (server, port):
+            idle = socket.create_connection(('127.0.0.1', port), timeout=10)
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                future = executor.submit(_exchange, port, b'GET /api/test/async/sleep?seconds=0.5 HTTP/1.1\r\n\r\n')
+                time.sleep(0.2)
+                server.stop()
+                response = future.result()
+            assert response.startswith(b'HTTP/1.1 200 OK')
+            assert b'Connection: close' in response
+            assert idle.recv(1024) == b''
+            idle.close()
+
+    def test_max_requests(self, app, async_routes):
+        """Stops after serving 'max_requests' requests."""
+        with _serving(app, max_requests=2) as (server, port):
+            for _ in range(2):
+                assert _exchange(port, b'GET /api/live HTTP/1.1\r\n\r\n', read_until_closed=False).startswith(b'HTTP/1.1 200')
+            assert server.requests == 2
+            assert server._stopping
+
+    def test_wsgi_middleware(self):
+        """Refuses an app whose wsgi_app is wrapped, since the middleware would never run."""
+        other_app = Flask('other')
+        other_app.wsgi_app = lambda environ, start_response: other_app.wsgi_app(environ, start_response)
+        with pytest.raises(ValueError):
+            AsyncWSGIServer('127.0.0.1', other_app, 0, threads=1)
+
+    def test_flask_version(self):
+        """Runs on the Flask version whose wsgi_app the server follows; compare _begin and _finish on upgrading."""
+        assert flask.__version__.startswith('1.1.')
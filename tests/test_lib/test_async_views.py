@@ -0,0 +1,108 @@
+"""
+Copyright ©2021. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import asyncio
+import gc
+import threading
+import time
+
+from flask import g, request
+import pytest
+from squiggy import db
+from squiggy.api.errors import BadRequestError
+from squiggy.lib import async_views
+from squiggy.lib.async_views import async_view, run_sync
+from squiggy.lib.http import tolerant_jsonify
+from squiggy.models.authorized_user import AuthorizedUser
+
+
+@async_view
+async def _echo_view(name):
+    await asyncio.sleep(0)
+    return tolerant_jsonify({'name': name, 'q': request.args.get('q')})
+
+
+@async_view
+async def _slow_view():
+    started_at = time.perf_counter()
+    await asyncio.gather(asyncio.sleep(0.2), asyncio.sleep(0.2), asyncio.sleep(0.2))
+    return time.perf_counter() - started_at
+
+
+@async_view
+async def _failing_view():
+    await asyncio.sleep(0)
+    raise BadRequestError('Nope')
+
+
+@async_view
+async def _user_view(uid):
+    user = await run_sync(AuthorizedUser.query.filter_by(uid=uid).first)
+    return user, user in db.session
+
+
+class TestAsyncViews:
+    """Coroutine views."""
+
+    def test_request_context(self, app):
+        """Reads the request, and returns a response, as sync views do."""
+        with app.test_request_context('/?q=yes'):
+            response = _echo_view('squiggy')
+        assert response.json == {'name': 'squiggy', 'q': 'yes'}
+
+    def test_concurrent_awaits(self, app):
+        """Awaits concurrently within one request."""
+        with app.test_request_context('/'):
+            assert _slow_view() < 0.5
+
+    def test_errors(self, app):
+        """Raises to the app's error handlers."""
+        with app.test_request_context('/'):
+            with pytest.raises(BadRequestError):
+                _failing_view()
+
+    def test_run_sync(self, app):
+        """Runs blocking DB calls on another thread, in the request's context and DB session."""
+        with app.test_request_context('/'):
+            app.preprocess_request()
+            user, attached = _user_view('2040')
+            assert attached
+            assert g.query_stats.count == 1
+            assert user.id == AuthorizedUser.get_id_per_uid('2040')
+
+    def test_thread_loops_closed(self, app):
+        """Closes a request thread's event loop when the thread exits."""
+        loops = []
+
+        def _request():
+            with app.test_request_context('/'):
+                _echo_view('squiggy')
+            loops.append(async_views._local.loop)
+
+        thread = threading.Thread(target=_request)
+        thread.start()
+        thread.join()
+        gc.collect()
+        assert loops[0].is_closed()
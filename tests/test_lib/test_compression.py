@@ -0,0 +1,74 @@
+"""
+Copyright ©2021. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import gzip
+import json
+
+from squiggy.lib.compression import compress_response, stats
+from squiggy.lib.http import conditional_response, tolerant_jsonify
+from tests.util import override_config
+
+
+class TestCompression:
+    """API response compression."""
+
+    def test_disabled(self, client):
+        """Leaves responses alone unless enabled."""
+        response = client.get('/api/config', headers={'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in response.headers
+
+    def test_compress(self, app):
+        """Gzips eligible responses, weakens their ETag and counts the bytes saved."""
+        @conditional_response()
+        def view():
+            return tolerant_jsonify([{'id': i, 'uid': str(i)} for i in range(1000)])
+
+        bytes_saved = stats.to_api_json()['bytesSaved']
+        with override_config(app, 'API_COMPRESSION_ENABLED', True):
+            with app.test_request_context(headers={'Accept-Encoding': 'gzip'}):
+                response = compress_response(app, view())
+                assert response.headers['Content-Encoding'] == 'gzip'
+                assert response.headers['Vary'] == 'Accept-Encoding'
+                assert len(json.loads(gzip.decompress(response.get_data()))) == 1000
+                etag = response.headers['ETag']
+                assert etag.startswith('W/')
+                assert stats.to_api_json()['bytesSaved'] > bytes_saved
+            with app.test_request_context(headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag}):
+                response = compress_response(app, view())
+                assert response.status_code == 304
+                assert 'Content-Encoding' not in response.headers
+
+    def test_threshold_and_client(self, app, client):
+        """Skips small responses and clients that do not accept gzip, but marks eligible responses as varying."""
+        with override_config(app, 'API_COMPRESSION_ENABLED', True):
+            response = client.get('/api/config', headers={'Accept-Encoding': 'gzip'})
+            assert 'Content-Encoding' not in response.headers
+            assert 'Vary' not in response.headers
+            with override_config(app, 'API_COMPRESSION_MIN_SIZE', 0):
+                response = client.get('/api/config')
+                assert 'Content-Encoding' not in response.headers
+                assert response.headers['Vary'] == 'Accept-Encoding'
+                response = client.get('/api/config', headers={'Accept-Encoding': 'gzip'})
+                assert response.headers['Vary'] == 'Accept-Encoding'
@@ -0,0 +1,85 @@
+"""
+Copyright ©2021. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import json
+import os
+
+import pytest
+from squiggy.lib.file_cache import FileCache
+
+
+def _write(path, content, mtime_ns):
+    path.write_text(content)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+class TestFileCache:
+    """File-backed asset cache."""
+
+    def test_parse_once(self, tmp_path):
+        """Does not re-read an unchanged file."""
+        path = tmp_path / 'build-summary.json'
+        _write(path, '{"build": 1}', 1_000_000_000)
+        loads = []
+        cache = FileCache(str(path), lambda data: loads.append(data) or json.loads(data), check_interval=0)
+        assert cache.get() == {'build': 1}
+        assert cache.get() == {'build': 1}
+        assert len(loads) == 1
+
+    def test_reload_on_change(self, tmp_path):
+        """Picks up a new version of the file at the next check."""
+        path = tmp_path / 'build-summary.json'
+        _write(path, '{"build": 1}', 1_000_000_000)
+        cache = FileCache(str(path), json.loads, check_interval=0)
+        assert cache.get() == {'build': 1}
+        _write(path, '{"build": 2}', 2_000_000_000)
+        assert cache.get() == {'build': 2}
+
+    def test_bounded_revalidation(self, tmp_path):
+        """Does not stat the file again within the check interval."""
+        path = tmp_path / 'build-summary.json'
+        _write(path, '{"build": 1}', 1_000_000_000)
+        cache = FileCache(str(path), json.loads, check_interval=3600)
+        assert cache.get() == {'build': 1}
+        _write(path, '{"build": 2}', 2_000_000_000)
+        assert cache.get() == {'build': 1}
+
+    def test_failed_reload(self, tmp_path):
+        """Keeps serving the last good value when a reload fails."""
+        path = tmp_path / 'build-summary.json'
+        _write(path, '{"build": 1}', 1_000_000_000)
+        cache = FileCache(str(path), json.loads, check_interval=0)
+        assert cache.get() == {'build': 1}
+        _write(path, '{"bui', 2_000_000_000)
+        assert cache.get() == {'build': 1}
+        _write(path, '{"build": 2}', 3_000_000_000)
+        assert cache.get() == {'build': 2}
+
+    def test_missing(self, tmp_path):
+        """Raises on a missing file unless told otherwise."""
+        path = str(tmp_path / 'index.html')
+        with pytest.raises(FileNotFoundError):
+            FileCache(path, bytes.decode).get()
+        assert FileCache(path, bytes.decode, missing_ok=True).get() is None
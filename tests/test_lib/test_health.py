@@ -0,0 +1,64 @@
+"""
+Copyright ©2021. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import threading
+import time
+
+from squiggy.lib.health import CachedHealthCheck
+
+
+class TestCachedHealthCheck:
+    """Cached, timeout-bounded health checks."""
+
+    def test_cached(self):
+        """Runs the check at most once per TTL."""
+        calls = []
+        health = CachedHealthCheck(lambda: calls.append(1) or True, ttl=60, timeout=1)
+        assert all(health.status() for _ in range(100))
+        assert len(calls) == 1
+
+    def test_background_refresh(self):
+        """Serves the cached result while a stale one is refreshed in the background."""
+        results = [True, False]
+        health = CachedHealthCheck(lambda: results.pop(0), ttl=0, timeout=1)
+        assert health.status() is True
+        # The refresh has started but this call does not wait for it.
+        health.status()
+        time.sleep(0.1)
+        assert health.status() is False
+
+    def test_timeout(self):
+        """Reports failure if the check hangs."""
+        release = threading.Event()
+        health = CachedHealthCheck(lambda: release.wait(5), ttl=60, timeout=0.05)
+        started_at = time.monotonic()
+        assert health.status() is False
+        assert time.monotonic() - started_at < 1
+        release.set()
+
+    def test_exception(self):
+        """Reports failure if the check raises."""
+        health = CachedHealthCheck(lambda: 1 / 0, ttl=60, timeout=1)
+        assert health.status() is False
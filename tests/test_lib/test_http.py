@@ -0,0 +1,70 @@
+"""
+Copyright ©2021. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import simplejson as json
+from squiggy.lib.http import conditional_response, tolerant_jsonify, tolerant_jsonify_stream
+
+
+class TestTolerantJsonify:
+    """JSON response helpers."""
+
+    def test_nan_is_null(self, app):
+        """Encodes NaN as null."""
+        response = tolerant_jsonify({'score': float('nan')})
+        assert response.mimetype == 'application/json'
+        assert json.loads(response.get_data()) == {'score': None}
+
+    def test_stream(self, app):
+        """Streams a generator as a JSON array, matching the non-streaming encoding."""
+        rows = ({'id': i, 'score': float('nan') if i % 2 else i} for i in range(1000))
+        with app.test_request_context():
+            response = tolerant_jsonify_stream(rows, chunk_size=256)
+            assert response.is_streamed
+            chunks = list(response.response)
+        assert len(chunks) > 1
+        expected = [{'id': i, 'score': None if i % 2 else i} for i in range(1000)]
+        assert json.loads(b''.join(chunks)) == expected
+        assert b''.join(chunks) == tolerant_jsonify(expected).get_data()
+
+    def test_stream_empty(self, app):
+        """Streams an empty iterable as an empty array."""
+        with app.test_request_context():
+            response = tolerant_jsonify_stream(iter([]))
+            assert b''.join(response.response) == b'[]'
+
+    def test_conditional_response(self, app):
+        """Hashes dynamic responses and honors If-None-Match."""
+        @conditional_response(max_age=60, private=True)
+        def view():
+            return tolerant_jsonify({'rows': list(range(10))})
+
+        with app.test_request_context():
+            response = view()
+            assert response.status_code == 200
+            assert response.cache_control.max_age == 60
+            assert response.cache_control.private
+            etag = response.headers['ETag']
+        with app.test_request_context(headers={'If-None-Match': etag}):
+            assert view().status_code == 304
@@ -0,0 +1,117 @@
+"""
+Copyright ©2021. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from dataclasses import asdict, dataclass
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum, Flag, IntEnum
+from uuid import UUID
+
+import pytest
+import simplejson as json
+from squiggy.lib.json_backends import get_dumps, simplejson_dumps
+
+payloads = [
+    {'score': float('nan'), 'max': float('inf'), 'ratio': 0.1 + 0.2},
+    {'price': Decimal('1.10'), 'rows': [Decimal('2'), 3]},
+    {1: 'non-string key', 'big': 2 ** 70},
+    ['é', ' ', None, True, (1, 2)],
+]
+
+
+class _Color(Enum):
+    RED = 'red'
+    TERM_START = date(2021, 1, 19)
+
+
+class _Priority(IntEnum):
+    HIGH = 1
+
+
+class _Permission(Flag):
+    READ = 4
+
+
+@dataclass
+class _Point:
+    x: int
+    y: int
+
+
+def _default(obj):
+    return obj.isoformat() if isinstance(obj, date) else asdict(obj)
+
+
+# Types that orjson handles natively or passes through, each paired with whether it needs the caller's 'default' hook.
+native_payloads = [
+    ({'id': UUID('12345678-1234-5678-1234-567812345678')}, False),
+    ({'color': _Color.RED, 'priority': _Priority.HIGH, 'permission': _Permission.READ}, False),
+    ({'start': _Color.TERM_START}, True),
+    ({'at': datetime(2021, 3, 1, 12, 30), 'on': date(2021, 3, 1)}, True),
+    ({'point': _Point(1, 2)}, True),
+]
+
+
+class TestJsonBackends:
+    """JSON encoder backends."""
+
+    @pytest.mark.parametrize('payload', payloads)
+    def test_orjson_matches_simplejson(self, payload):
+        """Decodes to the same document whichever backend encoded it."""
+        pytest.importorskip('orjson')
+        encoded = get_dumps('orjson')(payload)
+        assert json.loads(encoded, use_decimal=True) == json.loads(simplejson_dumps(payload), use_decimal=True)
+
+    def test_datetime_requires_default(self):
+        """Passes datetimes to the caller's default hook, as simplejson does."""
+        pytest.importorskip('orjson')
+        now = datetime(2021, 3, 1, 12, 30)
+        with pytest.raises(TypeError):
+            get_dumps('orjson')({'now': now})
+        encoded = get_dumps('orjson')({'now': now}, default=lambda o: o.isoformat())
+        assert json.loads(encoded) == {'now': '2021-03-01T12:30:00'}
+
+    @pytest.mark.parametrize('payload, needs_default', native_payloads)
+    def test_native_types_match(self, payload, needs_default):
+        """Encodes types orjson supports natively as simplejson does, or fails as simplejson does."""
+        pytest.importorskip('orjson')
+        backends = [get_dumps('orjson'), simplejson_dumps]
+        if needs_default:
+            for dumps in backends:
+                with pytest.raises(TypeError):
+                    dumps(payload)
+        else:
+            assert json.loads(backends[0](payload)) == json.loads(backends[1](payload))
+        decoded = [json.loads(dumps(payload, default=_default)) for dumps in backends]
+        assert decoded[0] == decoded[1]
+
+    def test_uuid_and_enum(self):
+        """Writes a UUID as its canonical string and an Enum member as its value."""
+        payload = {'id': UUID('12345678-1234-5678-1234-567812345678'), 'color': _Color.RED}
+        assert json.loads(simplejson_dumps(payload)) == {'id': '12345678-1234-5678-1234-567812345678', 'color': 'red'}
+
+    def test_unknown_backend(self):
+        """Falls back to simplejson."""
+        assert get_dumps('no-such-encoder') is simplejson_dumps
@@ -0,0 +1,75 @@
+"""
+Copyright ©2021. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import os
+import threading
+
+from squiggy.lib import metrics
+
+
+class TestMetrics:
+    """In-process request metrics."""
+
+    def test_short_lived_threads(self):
+        """Folds the shards of exited threads into one aggregate, keeping their counts."""
+        def record():
+            metrics.increment('squiggy_test_threads_total')
+            metrics.observe_latency((('route', '/test'),), 0.01)
+
+        shard_count = len(metrics._shards)
+        for _ in range(200):
+            thread = threading.Thread(target=record)
+            thread.start()
+            thread.join()
+        assert len(metrics._shards) <= shard_count + 1
+        counters, gauges, histograms = metrics.snapshot()
+        assert counters[('squiggy_test_threads_total', ())] == 200
+        assert histograms[(('route', '/test'),)][2] == 200
+
+    def test_shared_across_workers(self, app, monkeypatch, tmp_path):
+        """Adds up the samples of every prefork worker, keeping the counts but not the gauges of exited workers."""
+        monkeypatch.setattr(metrics, '_multiprocess_dir', str(tmp_path))
+        histogram = [[1] + [0] * len(metrics.LATENCY_BUCKETS), 0.001, 1]
+        for worker_id in (1, 2):
+            metrics._write_samples(
+                metrics._worker_path(worker_id),
+                {('squiggy_test_workers_total', ()): worker_id},
+                {('squiggy_test_workers_in_flight', ()): 1},
+                {(('route', '/test_workers'),): histogram},
+            )
+        metrics.retire_worker(1)
+        monkeypatch.setattr(metrics, '_worker_id', 3)
+        metrics.increment('squiggy_test_workers_total', value=4)
+        with app.app_context():
+            counters, gauges, histograms = metrics.collect()
+        assert counters[('squiggy_test_workers_total', ())] == 7
+        assert gauges[('squiggy_test_workers_in_flight', ())] == 1
+        assert histograms[(('route', '/test_workers'),)][2] == 2
+        assert sorted(os.listdir(tmp_path)) == ['archive.json', 'worker-2.json', 'worker-3.json']
+        # Once archived, a worker's samples are not counted again, even if its file is still there.
+        metrics.retire_worker(2)
+        metrics._write_samples(metrics._worker_path(2), {('squiggy_test_workers_total', ()): 100}, {}, {})
+        with app.app_context():
+            assert metrics.collect()[0][('squiggy_test_workers_total', ())] == 7
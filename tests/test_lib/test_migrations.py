@@ -0,0 +1,76 @@
+"""
+Copyright ©2021. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import pytest
+from sqlalchemy import text
+from squiggy import db
+from squiggy.lib.migrations import applied_migrations, fingerprint, load_migrations, migrate, Migration, MigrationError
+
+
+class TestMigrations:
+    """Versioned schema migrations."""
+
+    def test_load_migrations(self, app):
+        """Reads migrations in version order."""
+        migrations = load_migrations(app.config['BASE_DIR'] + '/scripts/db/migrations')
+        assert [(m.version, m.name) for m in migrations][:2] == [(1, 'create_authorized_users'), (2, 'create_sessions')]
+
+    def test_duplicate_versions(self, tmp_path):
+        """Refuses two migrations with the same version."""
+        (tmp_path / '0001_one.sql').write_text('SELECT 1')
+        (tmp_path / '001_two.sql').write_text('SELECT 2')
+        (tmp_path / 'README').write_text('Not a migration')
+        with pytest.raises(MigrationError):
+            load_migrations(str(tmp_path))
+
+    def test_migrate_is_idempotent(self, app):
+        """Records applied migrations and applies none of them twice."""
+        migrations = load_migrations(app.config['BASE_DIR'] + '/scripts/db/migrations')
+        assert applied_migrations(db.engine) == {m.version: m.checksum for m in migrations}
+        assert migrate(db.engine, migrations) == []
+
+    def test_changed_migration(self, app):
+        """Refuses to run when an applied migration has since been edited."""
+        migrations = load_migrations(app.config['BASE_DIR'] + '/scripts/db/migrations')
+        with pytest.raises(MigrationError):
+            migrate(db.engine, [migrations[0]._replace(checksum='edited')])
+
+    def test_no_statement_timeout(self):
+        """Runs migrations without the app's statement timeout."""
+        check = """DO $$ BEGIN
+            IF current_setting('statement_timeout') <> '0' THEN RAISE EXCEPTION 'statement_timeout is set'; END IF;
+        END $$"""
+        try:
+            assert len(migrate(db.engine, [Migration(9999, 'check_statement_timeout', check, 'checksum')])) == 1
+        finally:
+            with db.engine.begin() as connection:
+                connection.execute(text('DELETE FROM schema_migrations WHERE version = 9999'))
+
+    def test_fingerprint(self, app):
+        """Identifies a build by its migrations and extra inputs."""
+        migrations = load_migrations(app.config['BASE_DIR'] + '/scripts/db/migrations')
+        assert fingerprint(migrations, ['2040']) == fingerprint(migrations, ['2040'])
+        assert fingerprint(migrations, ['2040']) != fingerprint(migrations, ['2041'])
+        assert fingerprint(migrations) != fingerprint(migrations[:1])
@@ -0,0 +1,144 @@
+"""
+Copyright ©2021. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import json
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.request import Request, urlopen
+
+import pytest
+from squiggy import db
+from squiggy.lib.prefork import after_fork, PooledWSGIServer, PreforkServer
+from tests.util import override_config
+
+# Run in a fresh interpreter, so that the pytest process itself never forks.
+SERVER_SCRIPT = """
+import json, sys
+from squiggy.factory import create_app
+from squiggy.lib.prefork import PreforkServer
+app = create_app(config_overrides=json.loads(sys.argv[1]))
+options = {'host': '127.0.0.1', 'port': int(sys.argv[2]), 'workers': 1, 'threads': 2, 'max_requests': 1, 'max_requests_jitter': 0}
+PreforkServer.from_config(app, worker_class=sys.argv[3], **options).run()
+"""
+
+
+class TestPrefork:
+    """Prefork server."""
+
+    def test_from_config(self, app):
+        """Takes worker and thread counts from configs, unless overridden."""
+        with override_config(app, 'SERVER_WORKERS', 3):
+            server = PreforkServer.from_config(app, threads=8, port=None)
+        assert server.workers == 3
+        assert server.threads == 8
+        assert server.port == app.config['PORT']
+        assert server.max_requests == app.config['SERVER_MAX_REQUESTS']
+        assert server.worker_class == 'threads'
+        with pytest.raises(ValueError):
+            PreforkServer.from_config(app, worker_class='gevent')
+
+    def test_pooled_server(self, app):
+        """Serves requests from a listening socket until it has served 'max_requests'."""
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(8)
+        port = listener.getsockname()[1]
+        server = PooledWSGIServer('127.0.0.1', app, listener.fileno(), threads=2, max_requests=2)
+        thread = threading.Thread(target=server.serve)
+        thread.start()
+        try:
+            for _ in range(2):
+                with urlopen(f'http://127.0.0.1:{port}/api/live', timeout=5) as response:
+                    assert response.status == 200
+            thread.join(5)
+            assert not thread.is_alive()
+            assert server.requests == 2
+        finally:
+            server.stop()
+            listener.close()
+
+    def test_after_fork(self, app, client, monkeypatch):
+        """Drops state owned by the parent process."""
+        # Disposing for real would strand this test's connection in the old pool.
+        disposed = []
+        monkeypatch.setattr(db.engine, 'dispose', lambda: disposed.append(True))
+        client.get('/api/ping')
+        assert 'squiggy_database_health' in app.extensions
+        after_fork(app)
+        assert disposed
+        assert 'squiggy_database_health' not in app.extensions
+        assert client.get('/api/ping').json['db'] is True
+
+    @pytest.mark.parametrize('worker_class', ['asyncio', 'threads'])
+    def test_prefork_server(self, app, tmp_path, worker_class):
+        """Forks a worker after background warm-up, serves a request, recycles the worker and stops on SIGTERM."""
+        overrides = {
+            'DB_POOL_WARM_CONNECTIONS': 2,
+            'FAST_START_ENABLED': True,
+            'METRICS_AUTH_TOKEN': 'sesame',
+            'METRICS_MULTIPROCESS_DIR': str(tmp_path),
+            'SQLALCHEMY_DATABASE_URI': app.config['SQLALCHEMY_DATABASE_URI'],
+        }
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1]
+        master = subprocess.Popen(
+            [sys.executable, '-c', SERVER_SCRIPT, json.dumps(overrides), str(port), worker_class],
+            cwd=app.config['BASE_DIR'],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+        )
+        try:
+            response = _get_when_listening(f'http://127.0.0.1:{port}/api/ping', deadline=time.monotonic() + 30)
+            assert json.loads(response) == {'app': True, 'db': True}
+            # The worker exits after its one request and is replaced.
+            with urlopen(f'http://127.0.0.1:{port}/', timeout=10) as response:
+                assert response.read() == b'I am a Vue.js page.\n'
+            # A third worker reports the requests of the two before it.
+            scrape = Request(f'http://127.0.0.1:{port}/api/metrics', headers={'Authorization': 'Bearer sesame'})
+            with urlopen(scrape, timeout=10) as response:
+                text = response.read().decode('utf-8')
+            assert 'squiggy_http_requests_total{route="/api/ping",method="GET",status="200"} 1\n' in text
+            assert 'squiggy_http_requests_in_flight 1\n' in text
+        finally:
+            master.send_signal(signal.SIGTERM)
+            output = master.communicate(timeout=30)[0].decode('utf-8')
+        assert master.returncode == 0
+        assert 'exited with status 0; forking a replacement' in output
+
+
+def _get_when_listening(url, deadline):
+    while True:
+        try:
+            with urlopen(url, timeout=10) as response:
+                return response.read()
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
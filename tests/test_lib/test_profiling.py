@@ -0,0 +1,82 @@
+"""
+Copyright ©2021. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import os
+
+import pytest
+from squiggy.lib.profiling import list_profiles, PROFILE_HEADER, summarize_profile
+from squiggy.models.authorized_user import AuthorizedUser
+from tests.util import login_as, override_config
+
+
+class TestProfiling:
+    """Per-request profiler."""
+
+    def test_disabled(self, app, client, tmp_path):
+        """Ignores the profile flag unless profiling is enabled."""
+        with override_config(app, 'PROFILING_DIR', str(tmp_path)):
+            response = client.get('/api/config', headers={PROFILE_HEADER: '1'})
+        assert PROFILE_HEADER not in response.headers
+        assert list_profiles(str(tmp_path)) == []
+
+    def test_anonymous_flag(self, app, client, tmp_path):
+        """Ignores the profile flag from anyone but an admin."""
+        with override_config(app, 'PROFILING_ENABLED', True), override_config(app, 'PROFILING_DIR', str(tmp_path)):
+            response = client.get('/api/config?profile=1')
+        assert PROFILE_HEADER not in response.headers
+
+    @pytest.mark.parametrize('path, headers', [('/api/config', {PROFILE_HEADER: '1'}), ('/api/config?profile=1', {})])
+    def test_admin_flag(self, app, client, tmp_path, path, headers):
+        """Profiles the request of an admin who asks for it, by header or query parameter."""
+        login_as(client, '2040')
+        with override_config(app, 'PROFILING_ENABLED', True), override_config(app, 'PROFILING_DIR', str(tmp_path)):
+            response = client.get(path, headers=headers)
+        assert response.status_code == 200
+        filename = response.headers[PROFILE_HEADER]
+        assert [p['name'] for p in list_profiles(str(tmp_path))] == [filename]
+
+    def test_non_admin_flag(self, app, client, monkeypatch, tmp_path):
+        """Ignores the profile flag from an authenticated user who is not an admin."""
+        login_as(client, '2040')
+        monkeypatch.setattr(AuthorizedUser, 'is_admin', False)
+        with override_config(app, 'PROFILING_ENABLED', True), override_config(app, 'PROFILING_DIR', str(tmp_path)):
+            response = client.get('/api/config', headers={PROFILE_HEADER: '1'})
+        assert response.status_code == 200
+        assert PROFILE_HEADER not in response.headers
+        assert list_profiles(str(tmp_path)) == []
+
+    def test_sampled(self, app, client, tmp_path):
+        """Writes a profile of a sampled request."""
+        with override_config(app, 'PROFILING_ENABLED', True), \
+                override_config(app, 'PROFILING_DIR', str(tmp_path)), \
+                override_config(app, 'PROFILING_SAMPLE_RATE', 1.0):
+            response = client.get('/api/ping')
+        filename = response.headers[PROFILE_HEADER]
+        assert filename.endswith('ms.prof')
+        assert '-GET-api_ping-' in filename
+        profiles = list_profiles(str(tmp_path))
+        assert [p['name'] for p in profiles] == [filename]
+        summary = summarize_profile(os.path.join(tmp_path, filename), limit=5)
+        assert 'function calls' in summary
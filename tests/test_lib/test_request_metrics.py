@@ -0,0 +1,97 @@
+"""
+Copyright ©2021. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import json
+import logging
+
+import pytest
+from squiggy.lib.request_metrics import QueryBudgetExceededError, QueryCounter
+from squiggy.models.authorized_user import AuthorizedUser, user_cache
+from tests.util import login_as, override_config
+
+
+class TestAccessLog:
+    """Structured access log."""
+
+    def test_access_log_record(self, caplog, client):
+        """Logs timing, size and database usage as a JSON line."""
+        login_as(client, '2040')
+        # The user loader's query is the only one these requests make.
+        user_cache().clear()
+        with caplog.at_level(logging.DEBUG, logger='squiggy.access'):
+            client.get('/api/admin/db_pool')
+        records = [r for r in caplog.records if r.name == 'squiggy.access']
+        assert len(records) == 1
+        assert records[0].levelno == logging.DEBUG
+        entry = json.loads(records[0].getMessage())
+        assert entry['method'] == 'GET'
+        assert entry['path'] == '/api/admin/db_pool?'
+        assert entry['status'] == 200
+        assert entry['duration_ms'] > 0
+        assert entry['response_bytes'] > 0
+        assert entry['db_queries'] == 1
+        assert entry['db_time_ms'] > 0
+        assert entry['user_id'] == str(AuthorizedUser.get_id_per_uid('2040'))
+
+    def test_slow_request(self, app, caplog, client):
+        """Promotes slow requests to WARNING."""
+        with override_config(app, 'ACCESS_LOG_SLOW_REQUEST_MS', 0), caplog.at_level(logging.DEBUG, logger='squiggy.access'):
+            client.get('/api/config')
+        records = [r for r in caplog.records if r.name == 'squiggy.access']
+        assert records[0].levelno == logging.WARNING
+
+
+class TestQueryInstrumentation:
+    """SQL statement counts, budgets and N+1 detection."""
+
+    def test_query_counter(self):
+        """Counts statements by shape."""
+        with QueryCounter() as queries:
+            for uid in ['2040', '1133399', '2040']:
+                AuthorizedUser.query.filter_by(uid=uid).first()
+        assert queries.count == 3
+        assert queries.time > 0
+        assert len(queries.shapes) == 1
+        assert list(queries.repeated_statements(3).values()) == [3]
+        assert queries.repeated_statements(4) == {}
+
+    def test_budget_exceeded(self, app, client):
+        """Fails an over-budget request in test mode."""
+        login_as(client, '2040')
+        # The user loader's query is the only one these requests make.
+        user_cache().clear()
+        with override_config(app, 'SQL_QUERY_BUDGETS', {'db_pool_status': {'count': 0}}):
+            with pytest.raises(QueryBudgetExceededError):
+                client.get('/api/admin/db_pool')
+
+    def test_budget_logged(self, app, caplog, client):
+        """Logs an over-budget request if not raising."""
+        login_as(client, '2040')
+        # The user loader's query is the only one these requests make.
+        user_cache().clear()
+        with override_config(app, 'SQL_QUERY_BUDGETS', {'db_pool_status': {'time_ms': 0}}), \
+                override_config(app, 'SQL_QUERY_BUDGET_RAISE', False):
+            assert client.get('/api/admin/db_pool').status_code == 200
+        assert 'ms of SQL exceeds budget of 0 ms' in caplog.text
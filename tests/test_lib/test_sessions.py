@@ -0,0 +1,133 @@
+"""
+Copyright ©2021. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import pytest
+from sqlalchemy import text
+from squiggy import db
+from squiggy.lib.sessions import DatabaseSessionInterface
+from tests.util import login_as, override_config
+
+
+def _sets_cookie(response):
+    return 'Set-Cookie' in response.headers
+
+
+def _session_cookie(client):
+    return next(cookie.value for cookie in client.cookie_jar if cookie.name == 'session')
+
+
+@pytest.fixture()
+def database_sessions(app):
+    cookie_sessions = app.session_interface
+    app.session_interface = DatabaseSessionInterface(db.engine, app)
+    yield app.session_interface
+    app.session_interface = cookie_sessions
+
+
+class TestSessions:
+    """Session handling."""
+
+    def test_exempt_paths(self, client):
+        """Leaves sessions alone on health-check paths."""
+        login_as(client, '2040')
+        for path in ['/api/ping', '/api/live', '/api/ready']:
+            response = client.get(path)
+            assert not _sets_cookie(response)
+            assert 'Cookie' not in response.headers.get('Vary', '')
+
+    def test_anonymous(self, client):
+        """Sets no cookie for anonymous users."""
+        assert not _sets_cookie(client.get('/api/config'))
+
+    def test_sliding_refresh(self, client):
+        """Re-issues the session cookie only once the refresh interval has elapsed."""
+        login_as(client, '2040')
+        assert _sets_cookie(client.get('/api/config'))
+        assert not _sets_cookie(client.get('/api/config'))
+        with client.session_transaction() as session:
+            session['_refreshed_at'] -= 20 * 60
+        response = client.get('/api/config')
+        assert _sets_cookie(response)
+        assert 'Expires=' in response.headers['Set-Cookie']
+
+    def test_refresh_each_request(self, app, client):
+        """Re-issues the session cookie on every request if the refresh fraction is zero."""
+        login_as(client, '2040')
+        with override_config(app, 'SESSION_REFRESH_FRACTION', 0):
+            assert _sets_cookie(client.get('/api/config'))
+            assert _sets_cookie(client.get('/api/config'))
+
+
+class TestDatabaseSessions:
+    """Server-side sessions."""
+
+    def test_authenticated(self, client, database_sessions):
+        """Keeps session data in the database and an opaque id in the cookie."""
+        login_as(client, '2040')
+        sid = _session_cookie(client)
+        assert len(sid) == 43
+        with db.engine.connect() as connection:
+            data = connection.execute(text('SELECT data FROM sessions WHERE id = :sid'), {'sid': sid}).scalar()
+        assert '_user_id' in data
+        assert client.get('/api/admin/db_pool').status_code == 200
+
+        with client.session_transaction() as session:
+            session['launch'] = {'context': 'x' * 10000}
+        assert _session_cookie(client) == sid
+        assert client.get('/api/admin/db_pool').status_code == 200
+
+    def test_cached(self, client, database_sessions):
+        """Reads sessions through the in-process cache."""
+        login_as(client, '2040')
+        hits = database_sessions.cache.stats()['hits']
+        client.get('/api/config')
+        assert database_sessions.cache.stats()['hits'] == hits + 1
+
+    def test_forged_id(self, client, database_sessions):
+        """Treats an unknown session id as a new, anonymous session."""
+        client.set_cookie('localhost', 'session', 'x' * 43)
+        assert client.get('/api/admin/db_pool').status_code == 401
+
+    def test_clear(self, client, database_sessions):
+        """Deletes a session that has been emptied."""
+        login_as(client, '2040')
+        sid = _session_cookie(client)
+        with client.session_transaction() as session:
+            session.clear()
+        with db.engine.connect() as connection:
+            assert connection.execute(text('SELECT count(*) FROM sessions WHERE id = :sid'), {'sid': sid}).scalar() == 0
+
+    def test_cleanup(self, database_sessions):
+        """Deletes expired sessions in batches."""
+        with db.engine.begin() as connection:
+            for i in range(5):
+                connection.execute(
+                    text("INSERT INTO sessions VALUES (:sid, '{}', now() - interval '1 minute', now(), now())"),
+                    {'sid': f'expired-{i}'},
+                )
+        database_sessions.cleanup_batch_size = 2
+        assert database_sessions.cleanup() >= 5
+        with db.engine.connect() as connection:
+            assert connection.execute(text("SELECT count(*) FROM sessions WHERE id LIKE 'expired-%'")).scalar() == 0
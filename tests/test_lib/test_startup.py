@@ -0,0 +1,75 @@
+"""
+Copyright ©2021. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import threading
+import time
+
+from flask import Flask
+from squiggy.lib.startup import join_background_tasks, render_report, start_background_task, StartupTimer
+
+
+class TestStartup:
+    """Startup timing."""
+
+    def test_create_app_phases(self, app):
+        """Records the phases of create_app."""
+        phases = app.extensions['squiggy_startup_timings']
+        assert [p['name'] for p in phases if p['depth'] == 0] == [
+            'load_configs',
+            'initialize_logger',
+            'init_extensions',
+            'configure_engine',
+            'register_routes',
+        ]
+        assert 'import_controllers' in [p['name'] for p in phases if p['depth'] == 1]
+        assert 'squiggy_startup_timer' not in app.extensions
+
+    def test_render_report(self):
+        """Lists nested phases, the package import and the slowest imports."""
+        timer = StartupTimer()
+        with timer.phase('outer'):
+            with timer.phase('inner'):
+                pass
+        import_times = [
+            'import time: self [us] | cumulative | imported package',
+            'import time:       500 |     200000 | squiggy',
+            'import time:      9000 |       9000 |   flask',
+        ]
+        report = render_report(timer.to_api_json() + [{'name': 'total', 'depth': 0, 'ms': 10}], import_times, limit=1)
+        lines = report.splitlines()
+        assert lines[1].split() == ['import', 'squiggy', '200.0']
+        assert lines[2].startswith('outer')
+        assert lines[3].startswith('  inner')
+        assert lines[4].split() == ['total', '210.0']
+        assert lines[-1].split()[0] == 'flask'
+
+    def test_join_background_tasks(self):
+        """Waits for startup work left to background threads."""
+        app = Flask('squiggy')
+        done = threading.Event()
+        start_background_task(app, 'squiggy-test', lambda: time.sleep(0.1) or done.set())
+        join_background_tasks(app)
+        assert done.is_set()
+        assert 'squiggy_background_tasks' not in app.extensions
@@ -0,0 +1,102 @@
+"""
+Copyright ©2021. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import gzip
+import logging
+from logging.handlers import RotatingFileHandler
+import queue
+
+from squiggy.logger import _gzip_namer, _gzip_rotator, DroppingQueueHandler, DropReportingQueueListener
+
+
+class _ListHandler(logging.Handler):
+
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(self.format(record))
+
+
+class TestAsyncLogging:
+    """Queue-based logging."""
+
+    def test_drop_when_full(self):
+        """Drops records rather than block when the queue is full, and reports the drop."""
+        queue_handler = DroppingQueueHandler(queue.Queue(maxsize=2))
+        logger = logging.getLogger('squiggy.tests.async_logging')
+        logger.propagate = False
+        logger.addHandler(queue_handler)
+        for i in range(5):
+            logger.warning('Message %d', i)
+        assert queue_handler.dropped == 3
+
+        target = _ListHandler()
+        listener = DropReportingQueueListener(queue_handler, target)
+        listener.start()
+        listener.stop()
+        logger.removeHandler(queue_handler)
+        assert target.messages == [
+            'Log queue was full: 3 record(s) dropped.',
+            'Message 0',
+            'Message 1',
+        ]
+
+    def test_args_merged_when_logged(self):
+        """Renders args as they were when logged, not as they are when the listener gets to the record."""
+        queue_handler = DroppingQueueHandler(queue.Queue())
+        logger = logging.getLogger('squiggy.tests.async_logging_args')
+        logger.propagate = False
+        logger.addHandler(queue_handler)
+        uids = ['1']
+        logger.warning('Users %s', uids)
+        uids.append('2')
+        try:
+            raise ValueError('Boom')
+        except ValueError:
+            logger.exception('Failed for %d user(s)', len(uids))
+
+        target = _ListHandler()
+        listener = DropReportingQueueListener(queue_handler, target)
+        listener.start()
+        listener.stop()
+        logger.removeHandler(queue_handler)
+        assert target.messages[0] == "Users ['1']"
+        assert target.messages[1].startswith('Failed for 2 user(s)\nTraceback')
+        assert target.messages[1].endswith('ValueError: Boom')
+
+    def test_gzip_rotation(self, tmp_path):
+        """Compresses rotated log files."""
+        location = str(tmp_path / 'squiggy.log')
+        handler = RotatingFileHandler(location, maxBytes=100, backupCount=2)
+        handler.namer = _gzip_namer
+        handler.rotator = _gzip_rotator
+        for i in range(10):
+            handler.emit(logging.makeLogRecord({'msg': f'Line {i} ' + 'x' * 40}))
+        handler.close()
+        with gzip.open(location + '.1.gz') as rotated:
+            assert rotated.read().startswith(b'Line ')
+        assert not (tmp_path / 'squiggy.log.3.gz').exists()
@@ -23,8 +23,13 @@ SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
 ENHANCEMENTS, OR MODIFICATIONS.
 """
 
+from concurrent.futures import ThreadPoolExecutor
+import io
+
 import pytest
-from squiggy.models.authorized_user import AuthorizedUser
+from squiggy import db, std_commit
+from squiggy.lib.request_metrics import QueryCounter
+from squiggy.models.authorized_user import AuthorizedUser, uids_from_csv, user_cache
 
 unknown_uid = 'Ms. X'
 admin_uid = '2040'
@@ -43,3 +48,108 @@ class TestAuthorizedUser:
         """Returns authorization record to Flask-Login for recognized UID."""
         loaded_user = AuthorizedUser.find_by_uid(admin_uid)
         assert loaded_user.uid == admin_uid
+
+    def test_cached_lookups(self):
+        """Runs one query for repeated lookups of a user, by uid or id."""
+        with QueryCounter() as queries:
+            user = AuthorizedUser.find_by_uid(admin_uid)
+            assert AuthorizedUser.find_by_uid(admin_uid).id == user.id
+            assert AuthorizedUser.find_by_id(str(user.id)) is user
+            assert AuthorizedUser.get_id_per_uid(admin_uid) == user.id
+        assert queries.count == 1
+        assert user_cache().stats()['hits'] >= 3
+
+    def test_negative_cache(self):
+        """Caches unknown uids, until such a user is created."""
+        with QueryCounter() as queries:
+            assert AuthorizedUser.find_by_uid(coe_advisor_uid) is None
+            assert AuthorizedUser.find_by_uid(coe_advisor_uid) is None
+        assert queries.count == 1
+        db.session.add(AuthorizedUser(uid=coe_advisor_uid))
+        std_commit()
+        assert AuthorizedUser.find_by_uid(coe_advisor_uid).uid == coe_advisor_uid
+
+    def test_invalidate_on_update(self):
+        """Drops cached entries when a user row is written."""
+        user = AuthorizedUser.find_by_uid(admin_uid)
+        user.uid = 'renamed'
+        std_commit()
+        assert AuthorizedUser.find_by_uid(admin_uid) is None
+        assert AuthorizedUser.find_by_id(user.id).uid == 'renamed'
+
+    def test_user_cache_created_once(self, app):
+        """Builds one cache per app however many first requests race for it, and invalidates only that cache."""
+        original = app.extensions.pop('squiggy_user_cache')
+        try:
+            def _get_cache():
+                with app.app_context():
+                    return user_cache()
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                caches = set(executor.map(lambda _: _get_cache(), range(32)))
+            assert len(caches) == 1
+            original.not_found.set(('uid', coe_advisor_uid), True)
+            db.session.add(AuthorizedUser(uid=coe_advisor_uid))
+            std_commit()
+            assert original.not_found.get(('uid', coe_advisor_uid)) is True
+        finally:
+            app.extensions['squiggy_user_cache'] = original
+
+    def test_bulk_upsert(self):
+        """Inserts new uids and touches existing ones in a single statement."""
+        with QueryCounter() as queries:
+            counts = AuthorizedUser.bulk_upsert([admin_uid, 'new_1', 'new_2', 'new_1'])
+        assert queries.count == 1
+        assert counts == {'inserted': 2, 'updated': 1}
+        assert AuthorizedUser.bulk_upsert([]) == {'inserted': 0, 'updated': 0}
+
+    def test_bulk_upsert_invalidates_cache(self):
+        """Makes previously unknown uids visible to cached lookups."""
+        assert AuthorizedUser.find_by_uid(coe_advisor_uid) is None
+        AuthorizedUser.bulk_upsert([coe_advisor_uid])
+        std_commit()
+        assert AuthorizedUser.find_by_uid(coe_advisor_uid).uid == coe_advisor_uid
+
+    def test_bulk_upsert_invalidates_after_commit(self):
+        """Drops a negative entry cached by a concurrent reader between upsert and commit."""
+        # The session's commit ends only its own subtransaction; the outer one is rolled back to keep the test isolated.
+        outer_transaction = db.session.get_bind().begin()
+        try:
+            AuthorizedUser.bulk_upsert([coe_advisor_uid])
+            # A reader in another transaction does not yet see the row, and caches its absence.
+            assert user_cache().fetch('uid', coe_advisor_uid, lambda: None) is None
+            assert AuthorizedUser.find_by_uid(coe_advisor_uid) is None
+            db.session.commit()
+            assert AuthorizedUser.find_by_uid(coe_advisor_uid).uid == coe_advisor_uid
+        finally:
+            outer_transaction.rollback()
+
+    def test_uids_from_csv(self):
+        """Reads UIDs from a 'uid' column, found whatever its case or padding, or else from the first column."""
+        assert list(uids_from_csv(io.StringIO('name, UID \nAnn, 2040 \nBob,\n\nCy,1133399\n'))) == ['2040', '1133399']
+        assert list(uids_from_csv(io.StringIO(' uid \n2040\n'))) == ['2040']
+        assert list(uids_from_csv(io.StringIO('2040,Ann\n1133399\n'))) == ['2040', '1133399']
+
+    def test_uids_from_csv_blank_rows(self):
+        """Skips blank rows, including those before the header."""
+        assert list(uids_from_csv(io.StringIO('\n , \nuid\n\n2040\n'))) == ['2040']
+        assert list(uids_from_csv(io.StringIO('\n\n2040\n'))) == ['2040']
+        assert list(uids_from_csv(io.StringIO(''))) == []
+        assert list(uids_from_csv(io.StringIO('\n'))) == []
+
+    def test_get_ids_per_uid(self):
+        """Resolves many uids in one query per batch, skipping unknown and cached uids."""
+        admin_id = AuthorizedUser.get_id_per_uid(admin_uid)
+        AuthorizedUser.bulk_upsert(['new_1', 'new_2', 'new_3'])
+        with QueryCounter() as queries:
+            ids_per_uid = AuthorizedUser.get_ids_per_uid([admin_uid, 'new_1', 'new_2', 'new_3', unknown_uid], batch_size=2)
+        assert queries.count == 2
+        assert set(ids_per_uid) == {admin_uid, 'new_1', 'new_2', 'new_3'}
+        assert ids_per_uid[admin_uid] == admin_id
+
+    def test_get_ids_per_uid_warm_cache(self):
+        """Optionally caches the users it resolves."""
+        ids_per_uid = AuthorizedUser.get_ids_per_uid([admin_uid], warm_cache=True)
+        with QueryCounter() as queries:
+            assert AuthorizedUser.find_by_uid(admin_uid).id == ids_per_uid[admin_uid]
+            assert AuthorizedUser.find_by_id(ids_per_uid[admin_uid]).uid == admin_uid
+        assert queries.count == 0
@@ -0,0 +1,67 @@
+"""
+Copyright ©2021. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import gzip
+
+import pytest
+
+
+class TestFrontEndRoute:
+    """Front-end index document."""
+
+    def test_identity(self, client):
+        """Serves the index document uncompressed when the client does not ask otherwise."""
+        response = client.get('/some/vue/route')
+        assert response.status_code == 200
+        assert response.mimetype == 'text/html'
+        assert 'Content-Encoding' not in response.headers
+        assert b'I am a Vue.js page.' in response.data
+
+    def test_gzip(self, client):
+        """Serves the gzip encoding on request."""
+        plain = client.get('/').data
+        response = client.get('/', headers={'Accept-Encoding': 'gzip, deflate'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response.headers['Vary']
+        assert gzip.decompress(response.data) == plain
+
+    def test_brotli(self, client):
+        """Prefers brotli when available."""
+        brotli = pytest.importorskip('brotli')
+        plain = client.get('/').data
+        response = client.get('/', headers={'Accept-Encoding': 'gzip, deflate, br'})
+        assert response.headers['Content-Encoding'] == 'br'
+        assert brotli.decompress(response.data) == plain
+
+    def test_not_modified(self, client):
+        """Answers a matching If-None-Match with 304, per encoding."""
+        for accept_encoding in ['identity', 'gzip']:
+            etag = client.get('/', headers={'Accept-Encoding': accept_encoding}).headers['ETag']
+            response = client.get('/', headers={'Accept-Encoding': accept_encoding, 'If-None-Match': etag})
+            assert response.status_code == 304
+            assert not response.data
+        identity_etag = client.get('/').headers['ETag']
+        response = client.get('/', headers={'Accept-Encoding': 'gzip', 'If-None-Match': identity_etag})
+        assert response.status_code == 200
@@ -35,3 +35,15 @@ def override_config(app, key, value):
         yield
     finally:
         app.config[key] = old_value
+
+
+def login_as(client, uid):
+    """Start an authenticated session, as Flask-Login would, for the user with the given UID."""
+    from flask_login.utils import _create_identifier
+    from squiggy.models.authorized_user import AuthorizedUser
+    with client.application.test_request_context():
+        identifier = _create_identifier()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(AuthorizedUser.get_id_per_uid(uid))
+        session['_fresh'] = True
+        session['_id'] = identifier